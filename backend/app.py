@@ -11,11 +11,17 @@ if sys.platform == 'win32':
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from deep_translator import GoogleTranslator
+import re
 import time
 import json
 import requests
 import base64
 
+try:
+    import re2  # google-re2: linear-time DFA matching for the entity alternation
+except ImportError:
+    re2 = None
+
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*", "expose_headers": ["X-Sources"]}})
 
@@ -25,6 +31,26 @@ UPLOAD_URL = "https://script.google.com/macros/s/AKfycbyV_2016LPBRF4jBzxVLi0LLCY
 # Track active generation requests for interruption
 active_requests = {}
 
+# Legal entity extraction for summary cross-referencing, compiled once at import.
+# Section/Article citations never overlap, so they share one pass (findall yields a
+# (section, article) tuple per hit). The keyword categories do overlap ("evidence" in
+# "Indian Evidence Act", "order" in "stay order"), so each keeps its own scan.
+_entity_re = re2 if re2 is not None else re
+LEGAL_CITATION_PATTERN = _entity_re.compile(
+    r'(?i)(?:section|sec\.|§)\s*(\d+[A-Z]?(?:\(\d+\))?)'
+    r'|(?:article|art\.)\s*(\d+[A-Z]?)'
+)
+LEGAL_TERM_PATTERNS = {
+    # Act names (IPC, BNS, CrPC, etc.)
+    'act': _entity_re.compile(r'(?i)\b((?:Indian Penal Code|IPC|Bharatiya Nyaya Sanhita|BNS|Criminal Procedure Code|CrPC|Bharatiya Nagarik Suraksha Sanhita|BNSS|Indian Evidence Act|IEA|Bharatiya Sakshya Adhiniyam|BSA|IT Act))\b'),
+    # Crime types and charges
+    'crime': _entity_re.compile(r'(?i)\b(murder|rape|theft|robbery|assault|cheating|fraud|forgery|kidnapping|abduction|extortion|criminal breach of trust|dowry death|sexual harassment|culpable homicide|attempt to murder|voluntarily causing hurt|grievous hurt|defamation|bribery|corruption|money laundering|terrorism|sedition|criminal conspiracy|rioting|unlawful assembly)\b'),
+    # Legal concepts and procedures
+    'concept': _entity_re.compile(r'(?i)\b(bail|anticipatory bail|acquittal|conviction|appeal|revision|writ petition|habeas corpus|mandamus|certiorari|quo warranto|prohibition|injunction|stay order|interim order|life imprisonment|death sentence|rigorous imprisonment|fine|compensation|damages|sentence|punishment|penalty|probation|parole|remission|commutation)\b'),
+    # Legal terms specific to evidence and trial
+    'procedural': _entity_re.compile(r'(?i)\b(evidence|witness|testimony|cross-examination|examination-in-chief|prosecution|defense|accused|complainant|victim|appellant|respondent|petitioner|defendant|plaintiff|judgment|decree|order|direction|charge|framing of charges|trial|hearing|investigation|FIR|charge sheet|cognizance|summons|warrant|arrest)\b'),
+}
+
 @app.route('/')
 def hello_world():
     return jsonify({"message": "Hello from Flask Backend!"})
@@ -51,7 +77,7 @@ def get_uploads():
     if not os.path.exists(DB_FILE):
         return jsonify([])
     try:
-        with open(DB_FILE, 'r') as f:
+        with open(DB_FILE, 'r', encoding='utf-8') as f:
             content = f.read()
             if not content.strip():
                 return jsonify([])
@@ -328,19 +354,17 @@ def upload_file():
                     "summary": ""  # Empty, will be filled by streaming endpoint
                 }
 
-                # Save to local JSON DB
-                db_data = []
-                if os.path.exists(DB_FILE):
-                    try:
-                        with open(DB_FILE, 'r') as f:
-                            db_data = json.load(f)
-                    except json.JSONDecodeError:
-                        db_data = []
-                
-                db_data.append(new_record)
-                
-                with open(DB_FILE, 'w') as f:
-                    json.dump(db_data, f, indent=4)
+                # Save to local JSON DB (read-modify-write under the shared lock)
+                with core.json_file_lock(DB_FILE):
+                    db_data = []
+                    if os.path.exists(DB_FILE):
+                        try:
+                            db_data = core.read_json_file(DB_FILE)
+                        except json.JSONDecodeError:
+                            db_data = []
+                    
+                    db_data.append(new_record)
+                    core.write_json_file(DB_FILE, db_data, indent=True)
                 
                 # Return immediately - summary will be generated via WebSocket
                 return jsonify({"status": "success", "data": new_record, "temp_path": temp_path})
@@ -372,7 +396,7 @@ def chat():
         sources = []
         if os.path.exists(DB_FILE):
             try:
-                with open(DB_FILE, 'r') as f:
+                with open(DB_FILE, 'r', encoding='utf-8') as f:
                     db_data = json.load(f)
                     
                 for filename in source_filenames:
@@ -535,7 +559,7 @@ STRICT BEHAVIOR:
         sources = []
         if os.path.exists(DB_FILE):
             try:
-                with open(DB_FILE, 'r') as f:
+                with open(DB_FILE, 'r', encoding='utf-8') as f:
                     db_data = json.load(f)
                 
                 for filename in source_filenames:
@@ -649,6 +673,16 @@ STRICT BEHAVIOR:
     except Exception as e:
         emit('error', {'error': str(e)})
 
+def first_unique(items, limit):
+    """Returns up to `limit` distinct items in first-seen order, stopping early once full."""
+    seen = {}
+    for item in items:
+        if item not in seen:
+            seen[item] = None
+            if len(seen) >= limit:
+                break
+    return list(seen)
+
 @socketio.on('generate_summary')
 def handle_generate_summary(data):
     """
@@ -687,37 +721,37 @@ def handle_generate_summary(data):
         print(f"🔍 Extracting legal entities for cross-referencing...")
         legal_entities = []
         
-        # Extract sections, articles, chapters
-        sections = re.findall(r'(?:section|sec\.|§)\s*(\d+[A-Z]?(?:\(\d+\))?)', text, re.IGNORECASE)
-        articles = re.findall(r'(?:article|art\.)\s*(\d+[A-Z]?)', text, re.IGNORECASE)
-        
-        # Extract act names (IPC, BNS, CrPC, etc.)
-        acts = re.findall(r'\b((?:Indian Penal Code|IPC|Bharatiya Nyaya Sanhita|BNS|Criminal Procedure Code|CrPC|Bharatiya Nagarik Suraksha Sanhita|BNSS|Indian Evidence Act|IEA|Bharatiya Sakshya Adhiniyam|BSA|IT Act))\b', text, re.IGNORECASE)
-        
-        # Extract crime types and charges
-        crime_types = re.findall(r'\b(murder|rape|theft|robbery|assault|cheating|fraud|forgery|kidnapping|abduction|extortion|criminal breach of trust|dowry death|sexual harassment|culpable homicide|attempt to murder|voluntarily causing hurt|grievous hurt|defamation|bribery|corruption|money laundering|terrorism|sedition|criminal conspiracy|rioting|unlawful assembly)\b', text, re.IGNORECASE)
-        
-        # Extract legal concepts and procedures
-        legal_concepts = re.findall(r'\b(bail|anticipatory bail|acquittal|conviction|appeal|revision|writ petition|habeas corpus|mandamus|certiorari|quo warranto|prohibition|injunction|stay order|interim order|life imprisonment|death sentence|rigorous imprisonment|fine|compensation|damages|sentence|punishment|penalty|probation|parole|remission|commutation)\b', text, re.IGNORECASE)
+        # Extract sections and articles in one scan; exactly one group is set per hit
+        sections = []
+        articles = []
+        for section, article in LEGAL_CITATION_PATTERN.findall(text):
+            if section:
+                sections.append(section)
+            else:
+                articles.append(article)
         
-        # Extract legal terms specific to evidence and trial
-        procedural_terms = re.findall(r'\b(evidence|witness|testimony|cross-examination|examination-in-chief|prosecution|defense|accused|complainant|victim|appellant|respondent|petitioner|defendant|plaintiff|judgment|decree|order|direction|charge|framing of charges|trial|hearing|investigation|FIR|charge sheet|cognizance|summons|warrant|arrest)\b', text, re.IGNORECASE)
+        # Act names, crime types, legal concepts and trial/evidence terms
+        acts = LEGAL_TERM_PATTERNS['act'].findall(text)
+        crime_types = LEGAL_TERM_PATTERNS['crime'].findall(text)
+        legal_concepts = LEGAL_TERM_PATTERNS['concept'].findall(text)
+        procedural_terms = LEGAL_TERM_PATTERNS['procedural'].findall(text)
         
         # PRIORITIZED entity lists - specific terms first
         # Tier 1: Most specific and most likely to find good matches
+        # (order-preserving dedup, so the earliest mentions win and runs are deterministic)
         tier1_entities = []
-        tier1_entities.extend([f"Section {s}" for s in set(sections[:10])])
-        tier1_entities.extend([f"Article {a}" for a in set(articles[:5])])
-        tier1_entities.extend(list(set(acts[:5])))
+        tier1_entities.extend([f"Section {s}" for s in first_unique(sections, 10)])
+        tier1_entities.extend([f"Article {a}" for a in first_unique(articles, 5)])
+        tier1_entities.extend(first_unique(acts, 5))
         
         # Tier 2: Crime types (specific but may vary in terminology)
-        tier2_entities = list(set([c.lower() for c in crime_types]))[:8]
+        tier2_entities = first_unique((c.lower() for c in crime_types), 8)
         
         # Tier 3: Legal concepts (moderately specific)
-        tier3_entities = list(set([c.lower() for c in legal_concepts]))[:5]
+        tier3_entities = first_unique((c.lower() for c in legal_concepts), 5)
         
         # Tier 4: Procedural terms (very generic, use sparingly)
-        tier4_entities = list(set([p.lower() for p in procedural_terms]))[:3]
+        tier4_entities = first_unique((p.lower() for p in procedural_terms), 3)
         
         # Combine with priority
         legal_entities = tier1_entities + tier2_entities + tier3_entities + tier4_entities
@@ -796,12 +830,15 @@ def handle_generate_summary(data):
             # Sort by relevance score (HIGHER is better for FlashRank) and take top 10
             sorted_contexts = sorted(context_from_other_docs, key=lambda x: x.get('score', 0), reverse=True)[:10]
             
-            additional_context = "\n\n=== RELEVANT CONTEXT FROM OTHER LEGAL DOCUMENTS ===\n"
-            additional_context += f"(Found {len(context_from_other_docs)} related references across {len(referenced_docs)-1} documents)\n\n"
-            
-            for ctx in sorted_contexts:
-                additional_context += f"📄 {ctx['entity']} (from {ctx['source']}):\n"
-                additional_context += f"   {ctx['content'][:200]}...\n\n"
+            context_parts = [
+                "\n\n=== RELEVANT CONTEXT FROM OTHER LEGAL DOCUMENTS ===\n",
+                f"(Found {len(context_from_other_docs)} related references across {len(referenced_docs)-1} documents)\n\n"
+            ]
+            context_parts.extend(
+                f"📄 {ctx['entity']} (from {ctx['source']}):\n   {ctx['content'][:200]}...\n\n"
+                for ctx in sorted_contexts
+            )
+            additional_context = "".join(context_parts)
         
         # Enhanced prompt with cross-referencing
         prompt = f"""<|im_start|>system
@@ -910,23 +947,22 @@ Incorporate information from cross-referenced documents to provide complete lega
         # Update database with complete summary (both English and Hindi if available)
         if os.path.exists(DB_FILE):
             try:
-                with open(DB_FILE, 'r') as f:
-                    db_data = json.load(f)
-                
-                # Find and update the record
-                for record in db_data:
-                    if record['filename'] == filename:
-                        record['summary'] = full_summary
-                        if translated_summary:
-                            record['summary_hi'] = translated_summary
-                        record['status'] = 'uploaded'
-                        if chunk_ids:
-                             record['chunk_ids'] = chunk_ids
-                        break
-                
-                # Save updated database
-                with open(DB_FILE, 'w') as f:
-                    json.dump(db_data, f, indent=4)
+                with core.json_file_lock(DB_FILE):
+                    db_data = core.read_json_file(DB_FILE)
+                    
+                    # Find and update the record
+                    for record in db_data:
+                        if record['filename'] == filename:
+                            record['summary'] = full_summary
+                            if translated_summary:
+                                record['summary_hi'] = translated_summary
+                            record['status'] = 'uploaded'
+                            if chunk_ids:
+                                 record['chunk_ids'] = chunk_ids
+                            break
+                    
+                    # Save updated database
+                    core.write_json_file(DB_FILE, db_data, indent=True)
                 
                 print(f"✅ Summary generated and saved for {filename}")
             except Exception as e:
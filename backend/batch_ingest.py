@@ -14,8 +14,6 @@ INFO_DIR = os.path.join(BASE_DIR, "info")
 DB_FILE = os.path.join(BASE_DIR, 'uploads_db.json')
 UPLOAD_URL = "https://script.google.com/macros/s/AKfycbyV_2016LPBRF4jBzxVLi0LLCYAW6Hh1ET37KeEeF-JtyDe0oh9p0JOO26-g4TlpiSCzQ/exec"
 
-db_lock = threading.Lock()
-
 def process_file(filename):
     file_path = os.path.join(INFO_DIR, filename)
     
@@ -97,17 +95,14 @@ def process_file(filename):
         # Note: Master ingestion already updates uploads_db.json with structured data
         # But we also need to add Drive URL and thumbnail
         
-        with db_lock:
+        with core.json_file_lock(DB_FILE):
             # Load the JSON DB updated by master ingestion
-            if os.path.exists(DB_FILE):
+            db = {"documents": {}}
+            if os.path.exists(DB_FILE) and os.path.getsize(DB_FILE) > 0:
                 try:
-                    with open(DB_FILE, 'r', encoding='utf-8') as f:
-                        content = f.read().strip()
-                        db = json.loads(content) if content else {"documents": {}}
+                    db = core.read_json_file(DB_FILE)
                 except json.JSONDecodeError:
-                    db = {"documents": {}}
-            else:
-                db = {"documents": {}}
+                    pass
             
             # Find the document by file_id
             file_id = result.get('file_id')
@@ -119,8 +114,7 @@ def process_file(filename):
                 db['documents'][file_id]['lh3Thumbnail'] = thumbnail
                 db['documents'][file_id]['status'] = 'uploaded'
                 
-                with open(DB_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(db, f, indent=2, ensure_ascii=False)
+                core.write_json_file(DB_FILE, db, indent=True)
                 
                 print(f"✅ [{filename}] Database updated with Drive metadata")
             else:
@@ -141,7 +135,9 @@ def main():
         print(f"Directory not found: {INFO_DIR}")
         return
 
-    files = [f for f in os.listdir(INFO_DIR) if os.path.isfile(os.path.join(INFO_DIR, f))]
+    # One directory pass; DirEntry.is_file() uses the cached d_type instead of a stat per file
+    with os.scandir(INFO_DIR) as entries:
+        files = sorted(entry.name for entry in entries if entry.is_file())
     
     if not files:
         print("No files found in info directory.")
@@ -176,11 +176,12 @@ def run_batch_job():
         print(f" [ERROR] Error: Directory not found: {input_path}")
         return
     
-    all_files = [
-        os.path.join(input_path, f) 
-        for f in os.listdir(input_path) 
-        if f.lower().endswith('.pdf')
-    ]
+    with os.scandir(input_path) as entries:
+        all_files = sorted(
+            entry.path
+            for entry in entries
+            if entry.is_file() and entry.name.lower().endswith('.pdf')
+        )
     
     if not all_files:
         print("  No PDF files found in directory")
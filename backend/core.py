@@ -1,7 +1,13 @@
 import os
+import re
 import json
+import mmap
 import threading
 import hashlib
+import base64
+import tempfile
+from contextlib import contextmanager
+import numpy as np
 from typing import List, Optional
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
@@ -9,6 +15,21 @@ from langchain_community.llms import LlamaCpp
 import chromadb
 from chromadb.config import Settings
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from filelock import FileLock
+except ImportError:
+    FileLock = None
+
+try:
+    from llama_cpp import LlamaGrammar
+except ImportError:
+    LlamaGrammar = None
+
 try:
     from langchain_core.callbacks import CallbackManager, StreamingStdOutCallbackHandler
 except ImportError:
@@ -24,35 +45,123 @@ CHROMA_DB_DIR = os.path.join(BASE_DIR, "chroma_db")
 TEMP_DIR = os.path.join(BASE_DIR, "temp_uploads")
 CACHE_FILE = os.path.join(BASE_DIR, "answer_cache.json")
 EMBEDDING_CACHE_FILE = os.path.join(BASE_DIR, "embedding_cache.json")
+TRANSLATION_CACHE_FILE = os.path.join(BASE_DIR, "translation_cache.json")
 
 os.makedirs(TEMP_DIR, exist_ok=True)
 NUM_SHARDS = 3
 
+# Dynamic INT8 quantization of the embedder's Linear layers when running on CPU
+QUANTIZE_CPU_EMBEDDINGS = True
+
 # Global instances
 _embedding_function = None
 _llm = None
 _db_shards = []
 _response_cache = {}
 _embedding_cache = {}
+_translation_cache = {}
 
 # Locks
 cache_lock = threading.Lock()
 llm_lock = threading.Lock()
 embedding_lock = threading.Lock()
+db_lock = threading.Lock()
+
+def loads_json(data):
+    """Parses JSON from str or bytes, using orjson's C parser when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+_JSON_START_RE = re.compile(r'[\[{]')
+_json_decoder = json.JSONDecoder()
+
+def extract_json(text: str):
+    """
+    Parses the first complete JSON object/array in an LLM reply.
+    
+    Skips code fences and any prose before or after the value (e.g. "Here is the JSON:"),
+    without first rewriting the string.
+    """
+    for match in _JSON_START_RE.finditer(text):
+        try:
+            obj, _ = _json_decoder.raw_decode(text, match.start())
+            return obj
+        except ValueError:
+            continue
+    raise ValueError("No JSON value found in LLM response")
+
+# Files at least this large are parsed straight from a memory map (orjson only)
+MMAP_JSON_MIN_BYTES = 1_000_000
+
+def read_json_file(path):
+    """Reads a JSON file, using orjson's C parser when available."""
+    with open(path, 'rb') as f:
+        if orjson is not None and os.fstat(f.fileno()).st_size >= MMAP_JSON_MIN_BYTES:
+            # Parse from the page cache without copying the file into a bytes object
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    return orjson.loads(view)
+                finally:
+                    view.release()
+        data = f.read()
+    return loads_json(data)
+
+def write_json_file(path, obj, indent: bool = False):
+    """
+    Writes obj as UTF-8 JSON (2-space indented if requested), using orjson's C serializer when available.
+    The file is swapped in atomically, so readers never see (or mmap) a truncated file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        if orjson is not None:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0))
+        else:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(obj, f, indent=2 if indent else None, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+_json_file_locks = {}
+_json_file_locks_guard = threading.Lock()
+
+@contextmanager
+def json_file_lock(path):
+    """
+    Serializes read-modify-write cycles on a shared JSON file (e.g. uploads_db.json).
+    Always exclusive within this process; also across processes when filelock is installed.
+    """
+    key = os.path.abspath(path)
+    with _json_file_locks_guard:
+        lock = _json_file_locks.setdefault(key, threading.Lock())
+    with lock:
+        if FileLock is None:
+            yield
+        else:
+            with FileLock(key + ".lock"):
+                yield
 
 def load_persistent_caches():
-    global _response_cache, _embedding_cache
+    global _response_cache, _embedding_cache, _translation_cache
     if os.path.exists(CACHE_FILE):
         try:
-            with open(CACHE_FILE, 'r') as f:
-                _response_cache = json.load(f)
+            _response_cache = read_json_file(CACHE_FILE)
         except: _response_cache = {}
     
     if os.path.exists(EMBEDDING_CACHE_FILE):
         try:
-            with open(EMBEDDING_CACHE_FILE, 'r') as f:
-                _embedding_cache = json.load(f)
+            _embedding_cache = read_json_file(EMBEDDING_CACHE_FILE)
         except: _embedding_cache = {}
+    
+    if os.path.exists(TRANSLATION_CACHE_FILE):
+        try:
+            _translation_cache = read_json_file(TRANSLATION_CACHE_FILE)
+        except: _translation_cache = {}
 
 def save_persistent_caches():
     try:
@@ -61,28 +170,58 @@ def save_persistent_caches():
             cache_copy = _response_cache.copy()
             emb_cache_copy = _embedding_cache.copy()
             
-        with open(CACHE_FILE, 'w') as f:
-            json.dump(cache_copy, f)
-        with open(EMBEDDING_CACHE_FILE, 'w') as f:
-            json.dump(emb_cache_copy, f)
+        write_json_file(CACHE_FILE, cache_copy)
+        write_json_file(EMBEDDING_CACHE_FILE, emb_cache_copy)
     except Exception as e:
         print(f"Error saving caches: {e}")
 
+def save_translation_cache():
+    try:
+        with cache_lock:
+            trans_cache_copy = _translation_cache.copy()
+        write_json_file(TRANSLATION_CACHE_FILE, trans_cache_copy)
+    except Exception as e:
+        print(f"Error saving translation cache: {e}")
+
 # Load caches on startup
 load_persistent_caches()
 
+def pack_embedding(embedding: List[float]) -> str:
+    """
+    Quantizes an embedding to int8 with a per-vector float32 scale and encodes it as base64.
+    ~1KB per 768-d vector instead of ~10KB of JSON floats; cosine loss is well under 1%.
+    """
+    arr = np.asarray(embedding, dtype=np.float32)
+    scale = np.float32(np.abs(arr).max() / 127.0) or np.float32(1.0)
+    quantized = np.round(arr / scale).astype(np.int8)
+    return base64.b64encode(scale.tobytes() + quantized.tobytes()).decode('ascii')
+
+def unpack_embedding(value) -> List[float]:
+    """Decodes a packed int8 embedding; legacy float lists are returned unchanged."""
+    if not isinstance(value, str):
+        return value
+    payload = base64.b64decode(value)
+    scale = np.frombuffer(payload[:4], dtype=np.float32)[0]
+    return (np.frombuffer(payload[4:], dtype=np.int8).astype(np.float32) * scale).tolist()
+
+def embedding_cache_key(text: str) -> str:
+    """Non-cryptographic cache key; BLAKE2b is faster than MD5 and gives the same 32-char hex length."""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
 class CachedEmbeddings(HuggingFaceEmbeddings):
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         embeddings = []
         texts_to_embed = []
         indices_to_embed = []
         
+        # Hash once per text, outside the lock
+        text_hashes = [embedding_cache_key(text) for text in texts]
+        
         # 1. Check Cache
         with cache_lock:
-            for i, text in enumerate(texts):
-                text_hash = hashlib.md5(text.encode()).hexdigest()
+            for i, (text, text_hash) in enumerate(zip(texts, text_hashes)):
                 if text_hash in _embedding_cache:
-                    embeddings.append(_embedding_cache[text_hash])
+                    embeddings.append(unpack_embedding(_embedding_cache[text_hash]))
                 else:
                     embeddings.append(None)
                     texts_to_embed.append(text)
@@ -98,8 +237,7 @@ class CachedEmbeddings(HuggingFaceEmbeddings):
             with cache_lock:
                 for i, emb in zip(indices_to_embed, new_embeddings):
                     embeddings[i] = emb
-                    text_hash = hashlib.md5(texts[i].encode()).hexdigest()
-                    _embedding_cache[text_hash] = emb
+                    _embedding_cache[text_hashes[i]] = pack_embedding(emb)
             
             # Async save
             threading.Thread(target=save_persistent_caches).start()
@@ -117,6 +255,15 @@ def get_embedding_function():
             model_name=EMBEDDING_MODEL_PATH,
             model_kwargs={'device': device, 'trust_remote_code': True}
         )
+        if device == 'cpu' and QUANTIZE_CPU_EMBEDDINGS:
+            try:
+                # INT8 matmuls (VNNI where available) for the CPU-bound query embedding
+                _embedding_function.client = torch.quantization.quantize_dynamic(
+                    _embedding_function.client, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                print("Embedding model quantized to INT8 for CPU inference")
+            except Exception as e:
+                print(f"Embedding quantization skipped: {e}")
     return _embedding_function
 
 def get_llm():
@@ -135,6 +282,24 @@ def get_llm():
         )
     return _llm
 
+_json_grammar_cache = {}
+
+def get_json_grammar(schema: dict):
+    """
+    Returns a cached llama.cpp grammar that constrains generation to the given JSON schema.
+    Returns None when the installed llama_cpp cannot build one (callers then rely on parsing).
+    """
+    key = json.dumps(schema, sort_keys=True)
+    if key not in _json_grammar_cache:
+        grammar = None
+        if LlamaGrammar is not None:
+            try:
+                grammar = LlamaGrammar.from_json_schema(key, verbose=False)
+            except Exception as e:
+                print(f"⚠ JSON grammar unavailable, using unconstrained decoding: {e}")
+        _json_grammar_cache[key] = grammar
+    return _json_grammar_cache[key]
+
 def safe_llm_invoke(prompt: str, **kwargs):
     """
     Thread-safe wrapper for LLM generation.
@@ -159,51 +324,59 @@ def safe_llm_stream(prompt: str, **kwargs):
 
 def get_dbs():
     global _db_shards
-    if not _db_shards:
-        print(f"Initializing {NUM_SHARDS} Vector DB Shards...")
-        embedding_fn = get_embedding_function()
-        for i in range(NUM_SHARDS):
-            shard_dir = os.path.join(BASE_DIR, f"chroma_db_shard_{i}")
-            os.makedirs(shard_dir, exist_ok=True)
+    if _db_shards:
+        return _db_shards
+
+    # Shared clients for every request thread; initialize them once even under concurrent first hits
+    with db_lock:
+        if not _db_shards:
+            print(f"Initializing {NUM_SHARDS} Vector DB Shards...")
+            embedding_fn = get_embedding_function()
+            shards = []
+            for i in range(NUM_SHARDS):
+                shard_dir = os.path.join(BASE_DIR, f"chroma_db_shard_{i}")
+                os.makedirs(shard_dir, exist_ok=True)
             
-            # Create explicit ChromaDB client with proper settings
-            try:
-                client = chromadb.PersistentClient(
-                    path=shard_dir,
-                    settings=Settings(
-                        anonymized_telemetry=False,
-                        allow_reset=True
+                # Create explicit ChromaDB client with proper settings
+                try:
+                    client = chromadb.PersistentClient(
+                        path=shard_dir,
+                        settings=Settings(
+                            anonymized_telemetry=False,
+                            allow_reset=True
+                        )
                     )
-                )
                 
-                # Create or get collection
-                collection_name = f"shard_{i}"
+                    # Create or get collection
+                    collection_name = f"shard_{i}"
                 
-                # Try to get existing collection, or create new one
-                try:
-                    collection = client.get_collection(name=collection_name)
-                    print(f"  Loaded existing collection for shard {i}")
-                except:
-                    collection = client.create_collection(name=collection_name)
-                    print(f"  Created new collection for shard {i}")
-                
-                # Create Chroma instance with the client
-                db = Chroma(
-                    client=client,
-                    collection_name=collection_name,
-                    embedding_function=embedding_fn
-                )
-                _db_shards.append(db)
+                    # Try to get existing collection, or create new one
+                    try:
+                        collection = client.get_collection(name=collection_name)
+                        print(f"  Loaded existing collection for shard {i}")
+                    except:
+                        collection = client.create_collection(name=collection_name)
+                        print(f"  Created new collection for shard {i}")
                 
-            except Exception as e:
-                print(f"Error initializing shard {i}: {e}")
-                # Fallback to simple initialization
-                db = Chroma(
-                    persist_directory=shard_dir, 
-                    embedding_function=embedding_fn
-                )
-                _db_shards.append(db)
+                    # Create Chroma instance with the client
+                    db = Chroma(
+                        client=client,
+                        collection_name=collection_name,
+                        embedding_function=embedding_fn
+                    )
+                    shards.append(db)
                 
+                except Exception as e:
+                    print(f"Error initializing shard {i}: {e}")
+                    # Fallback to simple initialization
+                    db = Chroma(
+                        persist_directory=shard_dir, 
+                        embedding_function=embedding_fn
+                    )
+                    shards.append(db)
+            # Publish only fully-built shards so lock-free readers never see a partial list
+            _db_shards = shards
+
     return _db_shards
 
 def clear_cache():
@@ -220,6 +393,16 @@ def update_cache(query, answer, sources):
         _response_cache[query] = (answer, sources)
     save_persistent_caches()
 
+def get_cached_translation(text: str, target: str) -> Optional[str]:
+    with cache_lock:
+        return _translation_cache.get(f"{target}:{text}")
+
+def cache_translation(text: str, target: str, translated: str):
+    with cache_lock:
+        _translation_cache[f"{target}:{text}"] = translated
+    # Async save
+    threading.Thread(target=save_translation_cache).start()
+
 def get_similar_cache_entries(query: str, threshold: float = 0.85, max_results: int = 3):
     """
     Find semantically similar cached queries using embedding similarity.
@@ -6,11 +6,15 @@ Implements: Text Extraction → OCR Fallback → LLM Summary → Vector DB Inges
 import os
 import io
 import sys
+import queue
+import hashlib
 import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, Optional
 from PIL import Image
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 import docx
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 
@@ -31,6 +35,51 @@ if platform.system() == 'Windows':
         print("   Install from: https://github.com/UB-Mannheim/tesseract/wiki")
         print("   Or set custom path: pytesseract.pytesseract.tesseract_cmd = 'your_path'")
 
+# OCR settings: pages are rendered one at a time in a background thread,
+# at most OCR_PREFETCH_PAGES ahead of Tesseract, and OCR'd by OCR_WORKERS
+# concurrent Tesseract processes
+OCR_DPI = 300  # High DPI for better OCR
+OCR_GRAYSCALE = True  # Tesseract binarizes internally; RGB only triples the pixel data
+OCR_PREFETCH_PAGES = 2
+OCR_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+# Extracted PDF text is cached on disk keyed by the file's SHA-256, so re-ingesting
+# an unchanged PDF skips both PyPDF parsing and OCR
+PARSE_CACHE_DIR = os.path.join(core.BASE_DIR, "parse_cache")
+
+
+def file_sha256(file_path: str) -> str:
+    """Hashes a file in 1 MB blocks without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_cached_extraction(file_hash: str) -> Optional[Tuple[str, str]]:
+    """
+    Returns:
+        (extracted_text, method_used) from a previous run, or None on a miss
+    """
+    cache_path = os.path.join(PARSE_CACHE_DIR, f"{file_hash}.json")
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        entry = core.read_json_file(cache_path)
+        return entry["text"], entry["method"]
+    except Exception as e:
+        print(f"Parse cache read failed: {e}")
+        return None
+
+
+def save_cached_extraction(file_hash: str, text: str, method: str):
+    try:
+        os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+        core.write_json_file(os.path.join(PARSE_CACHE_DIR, f"{file_hash}.json"), {"text": text, "method": method})
+    except Exception as e:
+        print(f"Parse cache write failed: {e}")
+
 
 
 def extract_text_from_pdf(file_path: str) -> Tuple[str, str]:
@@ -42,11 +91,17 @@ def extract_text_from_pdf(file_path: str) -> Tuple[str, str]:
     """
     try:
         loader = PyPDFLoader(file_path)
-        docs = loader.load()
-        text = "\n".join([d.page_content for d in docs])
+        
+        # Stream pages into one buffer instead of holding every page Document for a join
+        buffer = io.StringIO()
+        for i, page in enumerate(loader.lazy_load()):
+            if i:
+                buffer.write("\n")
+            buffer.write(page.page_content)
+        text = buffer.getvalue()
         
         # Check if extraction was successful (non-empty and meaningful)
-        if text.strip() and len(text.strip()) > 50:
+        if len(text.strip()) > 50:
             return text, "standard_extraction"
         else:
             return "", "empty_extraction"
@@ -65,16 +120,60 @@ def extract_text_with_ocr(file_path: str) -> Tuple[str, str]:
     try:
         print("  → Falling back to OCR extraction...")
         
-        # Convert PDF pages to images
-        images = convert_from_path(file_path, dpi=300)  # High DPI for better OCR
+        page_count = pdfinfo_from_path(file_path)["Pages"]
+        
+        # Producer: render pages to images while the previous page is being OCR'd.
+        # Both poppler and tesseract run as subprocesses, so the two stages overlap.
+        pages = queue.Queue(maxsize=OCR_PREFETCH_PAGES)
+        stop = threading.Event()
+        
+        def render_pages():
+            try:
+                for page_num in range(1, page_count + 1):
+                    if stop.is_set():
+                        return
+                    for image in convert_from_path(file_path, dpi=OCR_DPI, grayscale=OCR_GRAYSCALE, first_page=page_num, last_page=page_num):
+                        pages.put(image)
+            except Exception as e:
+                pages.put(e)
+            finally:
+                pages.put(None)
         
+        renderer = threading.Thread(target=render_pages, daemon=True)
+        renderer.start()
+        
+        # Consumer: each page is an independent Tesseract subprocess, so pages are
+        # OCR'd concurrently by a thread pool; results are collected in page order
         all_text = []
-        for i, image in enumerate(images):
-            print(f"    → OCR processing page {i + 1}/{len(images)}...")
-            
-            # Perform OCR on each page
-            text = pytesseract.image_to_string(image, lang='eng+hin')  # English + Hindi support
-            all_text.append(text)
+        futures = []
+        
+        def collect_next():
+            all_text.append(futures[len(all_text)].result())
+            print(f"    → OCR processed page {len(all_text)}/{page_count}")
+        
+        try:
+            with ThreadPoolExecutor(max_workers=OCR_WORKERS) as ocr_pool:
+                while True:
+                    image = pages.get()
+                    if image is None:
+                        break
+                    if isinstance(image, Exception):
+                        raise image
+                    
+                    # Perform OCR on each page
+                    futures.append(ocr_pool.submit(pytesseract.image_to_string, image, lang='eng+hin'))  # English + Hindi support
+                    
+                    # Keep at most OCR_WORKERS pages in flight so rendered images don't pile up
+                    while len(futures) - len(all_text) > OCR_WORKERS:
+                        collect_next()
+                
+                while len(all_text) < len(futures):
+                    collect_next()
+        finally:
+            # Unblock the renderer if OCR failed part-way through
+            stop.set()
+            while not pages.empty():
+                pages.get_nowait()
         
         combined_text = "\n\n".join(all_text)
         
@@ -144,6 +243,13 @@ def extract_text_smart(file_path: str) -> Tuple[str, str]:
     ext = os.path.splitext(file_path)[1].lower()
     
     if ext == '.pdf':
+        # Reuse a previous extraction of the exact same file
+        file_hash = file_sha256(file_path)
+        cached = load_cached_extraction(file_hash)
+        if cached:
+            print("  ⚡ Using cached text extraction")
+            return cached
+        
         # Try standard extraction first
         text, method = extract_text_from_pdf(file_path)
         
@@ -152,6 +258,9 @@ def extract_text_smart(file_path: str) -> Tuple[str, str]:
             print(f"  ⚠️  Standard extraction {method}, trying OCR...")
             text, method = extract_text_with_ocr(file_path)
         
+        if text:
+            save_cached_extraction(file_hash, text, method)
+        
         return text, method
     
     elif ext == '.docx':
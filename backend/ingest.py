@@ -73,32 +73,8 @@ def ingest_document(file_path: str, original_filename: str, summary: str = "") -
         if not chunks:
             return []
 
-        # Use persistent DB
-        # Distribute chunks across shards
-        dbs = core.get_dbs()
-        shard_chunks = [[] for _ in range(core.NUM_SHARDS)]
-        
-        for i, chunk in enumerate(chunks):
-            shard_idx = i % core.NUM_SHARDS
-            shard_chunks[shard_idx].append(chunk)
-            
-        all_ids = []
-        all_ids = []
-        BATCH_SIZE = 32
-
-        for i, db_chunks in enumerate(shard_chunks):
-            if db_chunks:
-                total_chunks = len(db_chunks)
-                print(f"Ingesting {total_chunks} chunks to shard {i}...")
-                
-                for j in range(0, total_chunks, BATCH_SIZE):
-                    batch = db_chunks[j : j + BATCH_SIZE]
-                    try:
-                        ids = dbs[i].add_documents(batch)
-                        all_ids.extend(ids)
-                        print(f"  Processed batch {j//BATCH_SIZE + 1} ({len(batch)} chunks)")
-                    except Exception as batch_error:
-                        print(f"  Error processing batch {j//BATCH_SIZE + 1}: {batch_error}")
+        # Store across the vector shards (shared with the statute/judgment pipelines)
+        all_ids = smart_processor.store_to_vector_db(chunks)
         
         print(f"Ingested total {len(all_ids)} chunks for {original_filename}")
         
@@ -1,5 +1,34 @@
 import re
 
+# Markdown bold/italic/code/header characters, deleted with str.translate
+_MARKDOWN_DELETE = str.maketrans("", "", "*#_`")
+
+# Citation brackets like [1], [doc1.pdf] which break flow
+_CITATION_RE = re.compile(r"\[.*?\]")
+
+# Common legal abbreviations that TTS might mispronounce
+TTS_REPLACEMENTS = {
+    "Sec.": "Section",
+    "Art.": "Article",
+    "v.": "versus",
+    "Hon'ble": "Honorable",
+    "SC": "Supreme Court",
+    "HC": "High Court",
+    "IPC": "I-P-C", 
+    "CrPC": "Cr-P-C",
+    "BNS": "B-N-S",
+    "BNSS": "B-N-S-S",
+    "FIR": "F-I-R",
+    "vs": "versus"
+}
+
+# One alternation for all abbreviations (longest first, word boundaries so
+# substrings are not replaced incorrectly), resolved through the dict above
+_ABBREVIATION_RE = re.compile(
+    r'\b(?:' + '|'.join(re.escape(abbr) for abbr in sorted(TTS_REPLACEMENTS, key=len, reverse=True)) + r')\b'
+)
+_SEC_NUMBER_RE = re.compile(r'\bSec\s+(\d+)')
+
 def clean_for_tts(text):
     """
     Post-processing to ensure clean audio output.
@@ -8,36 +37,23 @@ def clean_for_tts(text):
     3. Adds pauses/breath markers if needed (heuristically).
     """
     # Remove markdown bold/italic/code identifiers
-    text = re.sub(r"[\*\#\_`]", "", text)
+    text = text.translate(_MARKDOWN_DELETE)
     
     # Remove citations brackets like [1], [doc1.pdf] which break flow
-    text = re.sub(r"\[.*?\]", "", text)
-    
-    # Expand common legal abbreviations for natural reading
-    replacements = {
-        "Sec.": "Section",
-        "Art.": "Article",
-        "v.": "versus",
-        "Hon'ble": "Honorable",
-        "SC": "Supreme Court",
-        "HC": "High Court",
-        "IPC": "I-P-C", 
-        "CrPC": "Cr-P-C",
-        "BNS": "B-N-S",
-        "BNSS": "B-N-S-S",
-        "FIR": "F-I-R",
-        "vs": "versus"
-    }
+    text = _CITATION_RE.sub("", text)
     
-    for abbr, full in replacements.items():
-        # Use word boundaries to avoid replacing substrings incorrectly
-        text = re.sub(r'\b' + re.escape(abbr) + r'\b', full, text)
+    # Expand common legal abbreviations for natural reading (single pass)
+    text = _ABBREVIATION_RE.sub(lambda m: TTS_REPLACEMENTS[m.group(0)], text)
         
     # Ensure "Section" is fully written out if "Sec" appears without dot
-    text = re.sub(r'\bSec\s+(\d+)', r'Section \1', text)
+    text = _SEC_NUMBER_RE.sub(r'Section \1', text)
 
     return text.strip()
 
+# Intent markers (set membership / one startswith call per query)
+CHIT_CHAT_PHRASES = frozenset(['hello', 'hi', 'hey', 'good morning', 'good evening', 'thanks', 'thank you', 'okay', 'ok', 'bye'])
+CLARIFIER_PREFIXES = ('what about', 'and if', 'is it', 'does it', 'why', 'how long', 'what if')
+
 def detect_intent(query):
     """
     Simple heuristic intent detection.
@@ -46,13 +62,11 @@ def detect_intent(query):
     q_lower = query.lower().strip()
     
     # Chit-Chat / Drivers
-    greetings = ['hello', 'hi', 'hey', 'good morning', 'good evening', 'thanks', 'thank you', 'okay', 'ok', 'bye']
-    if q_lower in greetings or len(q_lower.split()) < 2:
+    if q_lower in CHIT_CHAT_PHRASES or len(q_lower.split()) < 2:
         return 'chit_chat'
         
     # Clarification (Dependent on previous context)
-    clarifiers = ['what about', 'and if', 'is it', 'does it', 'why', 'how long', 'what if']
-    if any(q_lower.startswith(c) for c in clarifiers):
+    if q_lower.startswith(CLARIFIER_PREFIXES):
         return 'clarification'
         
     return 'new_query'
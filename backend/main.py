@@ -5,12 +5,13 @@ from pydantic import BaseModel
 from deep_translator import GoogleTranslator
 import time
 import os
-import json
 import requests
 import base64
 import sys
 from pathlib import Path
 
+import core  # Shared JSON DB helpers (json_file_lock, read/write_json_file)
+
 # Initialize FastAPI
 app = FastAPI(title="NineToFive API", version="1.0.0")
 
@@ -127,19 +128,17 @@ async def upload_file(file: UploadFile = File(...)):
                 "summary": "AI Summary Placeholder: This legal document contains clauses..."
             }
             
-            # Simple JSON DB (Not async safe for high load, but fine for prototype)
-            db_data = []
-            if os.path.exists(DB_FILE):
-                try:
-                    with open(DB_FILE, 'r') as f:
-                        db_data = json.load(f)
-                except:
-                    pass
-            
-            db_data.append(new_record)
-            
-            with open(DB_FILE, 'w') as f:
-                json.dump(db_data, f, indent=4)
+            # Simple JSON DB; read-modify-write under the lock shared with the ingest pipelines
+            with core.json_file_lock(DB_FILE):
+                db_data = []
+                if os.path.exists(DB_FILE):
+                    try:
+                        db_data = core.read_json_file(DB_FILE)
+                    except:
+                        pass
+                
+                db_data.append(new_record)
+                core.write_json_file(DB_FILE, db_data, indent=True)
                 
             return {"status": "success", "data": new_record}
         else:
@@ -203,9 +203,10 @@ IMPORTANT: Return ONLY the JSON object. No explanations.
         Output: List of 5 Metadata Objects
         """
         # Construct a combined prompt
-        combined_text = ""
-        for idx, (sid, stitle, stext) in enumerate(section_batch):
-            combined_text += f"\n--- ITEM {idx+1} ---\nSection {sid}: {stitle}\n{stext[:500]}..."
+        combined_text = "".join(
+            f"\n--- ITEM {idx+1} ---\nSection {sid}: {stitle}\n{stext[:500]}..."
+            for idx, (sid, stitle, stext) in enumerate(section_batch)
+        )
 
         prompt = f"""You are a legal metadata extractor. Analyze these {len(section_batch)} legal sections and return ONLY a JSON array.
 
@@ -378,6 +379,17 @@ class StatuteProcessor:
 # CASE PROCESSOR - Zone-Based Splitting for Judgments
 # ============================================================================
 
+# Judgment header patterns (case number, parties, High Court name)
+CASE_NUMBER_PATTERN = re.compile(
+    r'(?:W\.?P\.?|Crl\.?A\.?|C\.?A\.?|S\.?L\.?P\.?)\s*(?:\((?:Crl|Civ)\))?\s*(?:No\.?)?\s*(\d+(?:/\d+)?(?:\s+of\s+\d{4})?)',
+    re.IGNORECASE
+)
+PARTIES_PATTERN = re.compile(
+    r'(?P<petitioner>.+?)\s+(?:v\.|vs\.?|versus)\s+(?P<respondent>.+?)(?:\n|$)',
+    re.IGNORECASE
+)
+HIGH_COURT_PATTERN = re.compile(r'(\w+)\s+high court')
+
 class CaseProcessor:
     """
     Processes Court Judgments using Zone-Based chunking.
@@ -393,22 +405,24 @@ class CaseProcessor:
         Detects the current zone of the judgment.
         Uses keyword matching and position heuristics.
         """
-        text_lower = text.lower()
+        # Only the opening of the chunk is inspected; lowercase just that
+        head_lower = text[:300].lower()
+        opening_lower = head_lower[:200]
         
         # Zone detection patterns
-        if any(kw in text_lower[:300] for kw in ["fact", "factual background", "brief facts"]):
+        if any(kw in head_lower for kw in ["fact", "factual background", "brief facts"]):
             return "Facts"
         
-        if any(kw in text_lower[:200] for kw in ["issue", "question", "point for determination"]):
+        if any(kw in opening_lower for kw in ["issue", "question", "point for determination"]):
             return "Issues"
         
-        if any(kw in text_lower[:200] for kw in ["argument", "submission", "contention", "counsel argued"]):
+        if any(kw in opening_lower for kw in ["argument", "submission", "contention", "counsel argued"]):
             return "Arguments"
         
-        if any(kw in text_lower[:200] for kw in ["reasoning", "analysis", "discussion", "we find", "in our opinion"]):
+        if any(kw in opening_lower for kw in ["reasoning", "analysis", "discussion", "we find", "in our opinion"]):
             return "Reasoning"
         
-        if any(kw in text_lower[:200] for kw in ["order", "verdict", "judgment", "we hold", "conclusion", "disposed of"]):
+        if any(kw in opening_lower for kw in ["order", "verdict", "judgment", "we hold", "conclusion", "disposed of"]):
             return "Verdict"
         
         # Default: continue previous zone
@@ -418,32 +432,29 @@ class CaseProcessor:
         """
         Extracts case identification metadata from judgment text.
         """
-        lines = full_text.split('\n')[:50]  # Check first 50 lines
+        lines = full_text.split('\n', 50)[:50]  # Check first 50 lines
         text_sample = '\n'.join(lines)
         
         # Extract case number
-        case_num_match = re.search(
-            r'(?:W\.?P\.?|Crl\.?A\.?|C\.?A\.?|S\.?L\.?P\.?)\s*(?:\((?:Crl|Civ)\))?\s*(?:No\.?)?\s*(\d+(?:/\d+)?(?:\s+of\s+\d{4})?)',
-            text_sample,
-            re.IGNORECASE
-        )
+        case_num_match = CASE_NUMBER_PATTERN.search(text_sample)
         case_number = case_num_match.group(0) if case_num_match else "Unknown"
         
         # Extract parties
-        vs_match = re.search(r'(.+?)\s+(?:v\.|vs\.?|versus)\s+(.+?)(?:\n|$)', text_sample, re.IGNORECASE)
+        vs_match = PARTIES_PATTERN.search(text_sample)
         if vs_match:
-            petitioner = vs_match.group(1).strip()
-            respondent = vs_match.group(2).strip()
+            petitioner = vs_match.group('petitioner').strip()
+            respondent = vs_match.group('respondent').strip()
         else:
             petitioner = "Unknown"
             respondent = "Unknown"
         
         # Extract court
         court = "Unknown Court"
-        if "supreme court" in text_sample.lower():
+        sample_lower = text_sample.lower()
+        if "supreme court" in sample_lower:
             court = "Supreme Court of India"
-        elif "high court" in text_sample.lower():
-            hc_match = re.search(r'(\w+)\s+high court', text_sample.lower())
+        elif "high court" in sample_lower:
+            hc_match = HIGH_COURT_PATTERN.search(sample_lower)
             if hc_match:
                 court = f"{hc_match.group(1).title()} High Court"
         
@@ -480,7 +491,9 @@ class CaseProcessor:
         smart_chunks = []
         zones_map = {}
         
-        current_buffer = ""
+        # Collect segments and join once per emitted chunk (no repeated buffer copies)
+        buffer_parts = []
+        buffer_len = 0
         current_zone = "Facts"  # Default starting zone
         chunk_counter = 0
         
@@ -489,10 +502,13 @@ class CaseProcessor:
             if i % 2 == 1:  # These are the paragraph numbers
                 continue
             
-            current_buffer += segment + " "
+            buffer_parts.append(segment)
+            buffer_len += len(segment) + 1
             
             # Process when buffer reaches substantial size
-            if len(current_buffer) > 2000 or i >= len(segments) - 2:
+            if buffer_len > 2000 or i >= len(segments) - 2:
+                current_buffer = " ".join(buffer_parts) + " "
+                
                 # Detect zone
                 current_zone = self.detect_zone(current_buffer, current_zone)
                 
@@ -548,7 +564,8 @@ Full Text:
                         "legal_topic": enrichment['legal_topic']
                     }
                 
-                current_buffer = ""
+                buffer_parts = []
+                buffer_len = 0
         
         print(f"✓ Created {len(smart_chunks)} zone-based chunks")
         
@@ -653,27 +670,7 @@ class MasterIngestPipeline:
                 # C. STORE TO VECTOR DB
                 send_status(f"💾 Storing {len(smart_chunks)} chunks to Vector DB...")
                 
-                dbs = core.get_dbs()
-                all_uuids = []
-                
-                # Distribute across shards
-                shard_docs = [[] for _ in range(core.NUM_SHARDS)]
-                for i, doc in enumerate(smart_chunks):
-                    shard_idx = i % core.NUM_SHARDS
-                    shard_docs[shard_idx].append(doc)
-                
-                BATCH_SIZE = 32
-                for shard_idx, docs in enumerate(shard_docs):
-                    if not docs:
-                        continue
-                    
-                    for j in range(0, len(docs), BATCH_SIZE):
-                        batch = docs[j:j + BATCH_SIZE]
-                        try:
-                            ids = dbs[shard_idx].add_documents(batch)
-                            all_uuids.extend(ids)
-                        except Exception as e:
-                            print(f"  ✗ Batch storage failed: {e}")
+                all_uuids = smart_processor.store_to_vector_db(smart_chunks)
                 
                 # D. UPDATE JSON DB
                 send_status("📋 Updating Fast Brain (JSON Map)...")
@@ -710,27 +707,7 @@ class MasterIngestPipeline:
                 # C. STORE TO VECTOR DB
                 send_status(f"💾 Storing {len(smart_chunks)} chunks to Vector DB...")
                 
-                dbs = core.get_dbs()
-                all_uuids = []
-                
-                # Distribute across shards
-                shard_docs = [[] for _ in range(core.NUM_SHARDS)]
-                for i, doc in enumerate(smart_chunks):
-                    shard_idx = i % core.NUM_SHARDS
-                    shard_docs[shard_idx].append(doc)
-                
-                BATCH_SIZE = 32
-                for shard_idx, docs in enumerate(shard_docs):
-                    if not docs:
-                        continue
-                    
-                    for j in range(0, len(docs), BATCH_SIZE):
-                        batch = docs[j:j + BATCH_SIZE]
-                        try:
-                            ids = dbs[shard_idx].add_documents(batch)
-                            all_uuids.extend(ids)
-                        except Exception as e:
-                            print(f"  ✗ Batch storage failed: {e}")
+                all_uuids = smart_processor.store_to_vector_db(smart_chunks)
                 
                 # D. UPDATE JSON DB
                 send_status("📋 Updating Fast Brain (JSON Map)...")
@@ -782,14 +759,6 @@ class MasterIngestPipeline:
         Updates uploads_db.json with document metadata.
         """
         
-        # Load existing
-        if os.path.exists(self.json_db_path):
-            with open(self.json_db_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                db = json.loads(content) if content else {"documents": {}}
-        else:
-            db = {"documents": {}}
-        
         # Create entry
         if doc_type == "JUDGMENT":
             entry = {
@@ -805,11 +774,15 @@ class MasterIngestPipeline:
         else:
             entry = json_data  # Statute processor already creates proper format
         
-        db["documents"][file_id] = entry
-        
-        # Save
-        with open(self.json_db_path, 'w', encoding='utf-8') as f:
-            json.dump(db, f, indent=2, ensure_ascii=False)
+        # Load, update and save under the lock shared with the statute processor
+        with core.json_file_lock(self.json_db_path):
+            if os.path.exists(self.json_db_path) and os.path.getsize(self.json_db_path) > 0:
+                db = core.read_json_file(self.json_db_path)
+            else:
+                db = {"documents": {}}
+            
+            db["documents"][file_id] = entry
+            core.write_json_file(self.json_db_path, db, indent=True)
         
         print(f"✓ Updated JSON Map: {filename}")
 
@@ -1,11 +1,15 @@
 from sentence_transformers import CrossEncoder
 import core
 from typing import List, Dict, Any
+from functools import lru_cache
+from operator import itemgetter
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from deep_translator import GoogleTranslator
+import io
 import re
-import json
+import heapq
 import os
+import time
 import smart_retrieval  # Import the smart retrieval router
 
 
@@ -19,12 +23,34 @@ def load_uploads_db() -> List[Dict[str, Any]]:
     if not os.path.exists(db_path):
         return []
     try:
-        with open(db_path, 'r') as f:
-            return json.load(f)
+        return core.read_json_file(db_path)
     except Exception as e:
         print(f"Error loading uploads_db.json: {e}")
         return []
 
+SECTIONS_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sections_index.json')
+_sections_index_cache = {"mtime": None, "entries": []}
+
+def load_sections_index() -> List[tuple]:
+    """
+    Loads sections_index.json once and keeps it until the file changes.
+    
+    Returns:
+        List of (entry, lowercased keywords) pairs, so per-query matching
+        does no file I/O and no repeated lower() calls
+    """
+    if not os.path.exists(SECTIONS_INDEX_PATH):
+        return []
+    mtime = os.path.getmtime(SECTIONS_INDEX_PATH)
+    if _sections_index_cache["mtime"] != mtime:
+        sections_map = core.read_json_file(SECTIONS_INDEX_PATH)
+        _sections_index_cache["entries"] = [
+            (entry, tuple(kw.lower() for kw in entry.get('keywords', [])))
+            for entry in sections_map
+        ]
+        _sections_index_cache["mtime"] = mtime
+    return _sections_index_cache["entries"]
+
 # User-defined Core Documents Priority List
 # "refer(the summaries) from these first"
 CORE_DOC_MAPPING = {
@@ -39,6 +65,49 @@ CORE_DOC_MAPPING = {
     'TCOI': 'TCOI'
 }
 
+# Stream coalescing: flush buffered tokens once this many chars are pending
+# or this many seconds have passed, so the client gets fewer, larger frames.
+STREAM_FLUSH_CHARS = 256
+STREAM_FLUSH_INTERVAL = 0.04
+
+# Category tag -> full act name
+CATEGORY_TAG_MAPPING = {
+    'ipc': 'Indian Penal Code (IPC)',
+    'bns': 'Bharatiya Nyaya Sanhita (BNS)',
+    'crpc': 'Criminal Procedure Code (CrPC)',
+    'bnss': 'Bharatiya Nagarik Suraksha Sanhita (BNSS)',
+    'iea': 'Indian Evidence Act (IEA)',
+    'bsa': 'Bharatiya Sakshya Adhiniyam (BSA)',
+}
+
+# Pre-formatted category focus instructions for the system prompt
+_CATEGORY_SUFFIX = {
+    tag: f"\nIMPORTANT: Focus specifically on information related to {name}.\n"
+    for tag, name in CATEGORY_TAG_MAPPING.items()
+}
+
+# Output-language requirements appended to the grounded system prompt
+_HI_SUFFIX = """
+OUTPUT LANGUAGE REQUIREMENT:
+- You MUST respond in Hindi using Devanagari script (हिंदी में उत्तर दें).
+- Keep sentences short and clear.
+"""
+_HINGLISH_SUFFIX = """
+OUTPUT LANGUAGE REQUIREMENT:
+- You MUST respond in "Romanized Hindi" (Hinglish).
+- Do not use Devanagari script.
+- Example: "IPC Section 302 ke tehat punishment..."
+"""
+
+# Appended to the user's turn to keep the model grounded on citations
+SAFETY_REMINDER = "\n\n🚨 REMINDER: Check every legal citation against the context above. If a Section/Article is not listed verbatim in the context, DO NOT cite it."
+
+# Post-stream work (citation check, cache save) runs on one background worker
+_post_answer_executor = ThreadPoolExecutor(max_workers=1)
+
+# Prompt history budget (approximate tokens) so one long paste can't blow up prefill
+HISTORY_TOKEN_BUDGET = 1500
+
 def search_uploads_index(query: str) -> List[Dict[str, Any]]:
     """
     Searches uploads_db.json for documents matching the query.
@@ -119,52 +188,158 @@ def extract_conversation_topics(chat_history: List[dict]) -> List[str]:
             keywords = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', content)
             topics.extend(keywords[:3])  # Limit to 3 keywords per message
     
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_topics = []
+    # Remove duplicates (case-insensitive) while preserving order: first spelling wins
+    unique_topics = {}
     for topic in topics:
-        topic_lower = topic.lower()
-        if topic_lower not in seen:
-            seen.add(topic_lower)
-            unique_topics.append(topic)
+        unique_topics.setdefault(topic.lower(), topic)
     
-    return unique_topics[:5]  # Return top 5 topics
+    return list(unique_topics.values())[:5]  # Return top 5 topics
 
-def analyze_query_complexity(query: str) -> dict:
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token) without touching the LLM tokenizer."""
+    return len(text) // 4 + 1
+
+def trim_history_by_tokens(chat_history: List[dict], max_messages: int, budget: int = HISTORY_TOKEN_BUDGET) -> List[dict]:
     """
-    Analyzes query to determine its complexity and type.
-    Returns: {'type': str, 'confidence': float, 'keywords': list}
-    Types: 'simple', 'complex', 'comparative', 'procedural'
+    Keeps the most recent messages that fit in the token budget, dropping oldest first.
+    The latest message is always kept, truncated to the budget if it alone exceeds it.
+    Returns messages in chronological order.
     """
-    query_lower = query.lower()
-    
-    # Complexity indicators
-    complex_indicators = [
+    selected = []
+    used = 0
+    for msg in reversed(chat_history[-max_messages:]):
+        n_tokens = estimate_tokens(msg.get('content', ''))
+        if used + n_tokens > budget:
+            if not selected:
+                # Cut to the length estimate_tokens maps onto the budget
+                selected.append({**msg, 'content': msg.get('content', '')[:(budget - 1) * 4]})
+            break
+        selected.append(msg)
+        used += n_tokens
+    selected.reverse()
+    return selected
+
+# Query complexity indicators
+QUERY_INDICATORS = {
+    'complex': [
         'explain', 'analyze', 'compare', 'contrast', 'difference', 'between',
         'why', 'how does', 'what are the implications', 'discuss', 'elaborate',
         'relationship', 'impact', 'effect', 'consequence', 'versus', 'vs'
-    ]
-    
-    procedural_indicators = [
+    ],
+    'procedural': [
         'procedure', 'process', 'steps', 'how to', 'method', 'way to',
         'file', 'apply', 'register', 'obtain', 'submit'
-    ]
-    
-    comparative_indicators = [
+    ],
+    'comparative': [
         'compare', 'contrast', 'difference', 'between', 'versus', 'vs',
         'similar', 'different', 'both', 'either'
-    ]
-    
-    simple_indicators = [
+    ],
+    'simple': [
         'what is', 'define', 'who is', 'when', 'where', 'which section',
         'section', 'article', 'clause', 'punishment', 'penalty'
-    ]
+    ],
+}
+
+# Single-word indicators are matched as whole tokens via set intersection, so
+# 'section' no longer fires inside 'intersectional' or 'file' inside 'profile'
+_INDICATOR_WORDS = {
+    bucket: frozenset(ind for ind in indicators if ' ' not in ind)
+    for bucket, indicators in QUERY_INDICATORS.items()
+}
+
+# Multi-word phrase -> buckets it counts towards
+_PHRASE_BUCKETS = {}
+for _bucket, _indicators in QUERY_INDICATORS.items():
+    for _ind in _indicators:
+        if ' ' in _ind:
+            _PHRASE_BUCKETS.setdefault(_ind, []).append(_bucket)
+
+# Single-pass Aho-Corasick matcher over the phrases (optional dependency)
+try:
+    import ahocorasick
+    _PHRASE_AC = ahocorasick.Automaton()
+    for _phrase in _PHRASE_BUCKETS:
+        _PHRASE_AC.add_word(_phrase, _phrase)
+    _PHRASE_AC.make_automaton()
+except ImportError:
+    _PHRASE_AC = None
+
+# Fallback: one compiled alternation scanned once. The lookahead allows overlapping
+# matches; longest alternatives go first.
+_PHRASES_RE = re.compile(
+    '(?=(' + '|'.join(map(re.escape, sorted(_PHRASE_BUCKETS, key=len, reverse=True))) + '))'
+)
+
+# Per-type retrieval parameters, folded into the analysis result
+_BASE_CHUNK_COUNTS = {
+    'simple': 3,
+    'complex': 6,
+    'comparative': 8,
+    'procedural': 5
+}
+
+_RELEVANCE_THRESHOLDS = {
+    'simple': 1.2,      # Strict - we want exact matches
+    'complex': 1.8,     # More lenient - need broader context
+    'comparative': 2.0,  # Very lenient - need diverse sources
+    'procedural': 1.5   # Moderate - need step-by-step info
+}
+
+def _base_chunk_count(query_type: str, confidence: float) -> int:
+    chunk_count = _BASE_CHUNK_COUNTS.get(query_type, 4)
+    # Adjust based on confidence
+    if confidence > 0.8:
+        chunk_count += 1
+    return chunk_count
+
+def _base_relevance_threshold(query_type: str, confidence: float) -> float:
+    threshold = _RELEVANCE_THRESHOLDS.get(query_type, 1.5)
+    # Adjust based on confidence
+    if confidence < 0.6:
+        threshold += 0.3  # Be more lenient if uncertain
+    return threshold
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_LEGAL_TERM_RE = re.compile(r'\b(?:section|article|clause|act|code|rule|regulation|amendment)\s+\d+[a-z]?\b')
+
+def count_query_indicators(query_lower: str) -> Dict[str, int]:
+    """
+    Counts how many distinct indicators of each bucket occur in the query.
+    Returns: {'complex': int, 'procedural': int, 'comparative': int, 'simple': int}
+    """
+    tokens = set(_TOKEN_RE.findall(query_lower))
+    counts = {bucket: len(tokens & words) for bucket, words in _INDICATOR_WORDS.items()}
+    
+    if _PHRASE_AC is not None:
+        phrases = {phrase for _, phrase in _PHRASE_AC.iter(query_lower)}
+    else:
+        phrases = {m.group(1) for m in _PHRASES_RE.finditer(query_lower)}
+    for phrase in phrases:
+        for bucket in _PHRASE_BUCKETS[phrase]:
+            counts[bucket] += 1
+    return counts
+
+def analyze_query_complexity(query: str) -> dict:
+    """
+    Analyzes query to determine its complexity and type.
+    Results are memoized per query string; each call gets its own copy.
+    Returns: {'type': str, 'confidence': float, 'keywords': list, 'word_count': int,
+              'base_chunks': int, 'base_threshold': float}
+    Types: 'simple', 'complex', 'comparative', 'procedural'
+    """
+    result = _analyze_query_complexity_impl(query)
+    return {**result, 'keywords': list(result['keywords'])}
+
+@lru_cache(maxsize=4096)
+def _analyze_query_complexity_impl(query: str) -> dict:
+    query_lower = query.lower()
     
     # Count indicators
-    complex_count = sum(1 for ind in complex_indicators if ind in query_lower)
-    procedural_count = sum(1 for ind in procedural_indicators if ind in query_lower)
-    comparative_count = sum(1 for ind in comparative_indicators if ind in query_lower)
-    simple_count = sum(1 for ind in simple_indicators if ind in query_lower)
+    counts = count_query_indicators(query_lower)
+    complex_count = counts['complex']
+    procedural_count = counts['procedural']
+    comparative_count = counts['comparative']
+    simple_count = counts['simple']
     
     # Question length (longer questions tend to be more complex)
     word_count = len(query.split())
@@ -192,31 +367,25 @@ def analyze_query_complexity(query: str) -> dict:
             confidence = 0.5
     
     # Extract key legal terms
-    legal_terms = re.findall(r'\b(?:section|article|clause|act|code|rule|regulation|amendment)\s+\d+[a-z]?\b', query_lower)
+    legal_terms = _LEGAL_TERM_RE.findall(query_lower)
     
     return {
         'type': query_type,
         'confidence': confidence,
-        'keywords': legal_terms,
-        'word_count': word_count
+        'keywords': tuple(legal_terms),
+        'word_count': word_count,
+        'base_chunks': _base_chunk_count(query_type, confidence),
+        'base_threshold': _base_relevance_threshold(query_type, confidence)
     }
 
 def determine_chunk_count(query_complexity: dict, category_tag: str = None) -> int:
     """
     Determines optimal number of chunks to retrieve based on query complexity.
+    Uses the 'base_chunks' precomputed by analyze_query_complexity when present.
     """
-    base_counts = {
-        'simple': 3,
-        'complex': 6,
-        'comparative': 8,
-        'procedural': 5
-    }
-    
-    chunk_count = base_counts.get(query_complexity['type'], 4)
-    
-    # Adjust based on confidence
-    if query_complexity['confidence'] > 0.8:
-        chunk_count += 1
+    chunk_count = query_complexity.get('base_chunks')
+    if chunk_count is None:
+        chunk_count = _base_chunk_count(query_complexity['type'], query_complexity['confidence'])
     
     # If category tag is specified, we can be more focused
     if category_tag:
@@ -330,19 +499,44 @@ def rerank_results(query: str, results: List[tuple], top_k: int = 5) -> List[tup
             if doc_id in doc_map:
                 final_results.append((doc_map[doc_id], score))
             
-        # Sort by score DESCENDING (FlashRank returns 0.0 to 1.0, higher is better)
-        # (Though FlashRank usually returns them sorted, we ensure it)
-        final_results.sort(key=lambda x: x[1], reverse=True)
+        # Top-k by score DESCENDING (FlashRank returns 0.0 to 1.0, higher is better)
+        # (Though FlashRank usually returns them sorted, we ensure it) - O(n log k), no full sort
+        final_results = heapq.nlargest(top_k, final_results, key=itemgetter(1))
         
         if final_results:
              print(f"   Top FlashRank score: {final_results[0][1]:.4f}")
              
-        return final_results[:top_k]
+        return final_results
         
     except Exception as e:
         print(f"FlashRank failed: {e}")
         return results[:top_k]
 
+# Near-duplicate detection: bottom-k (KMV) sketch over word 5-gram shingles
+DEDUP_SHINGLE_SIZE = 5
+DEDUP_SKETCH_SIZE = 8
+DEDUP_MIN_OVERLAP = 6  # shared sketch hashes (out of 8) to treat two chunks as duplicates
+
+# Fuzzy near-duplicate check on a content sample (optional dependency)
+try:
+    from rapidfuzz import fuzz, process as fuzz_process
+except ImportError:
+    fuzz = None
+DEDUP_SAMPLE_CHARS = 500
+DEDUP_FUZZY_CUTOFF = 92
+
+def shingle_sketch(text: str) -> frozenset:
+    """
+    Returns the DEDUP_SKETCH_SIZE smallest hashes of the text's word shingles.
+    Chunks with heavily overlapping sketches are near-duplicates (e.g. the same
+    section stored in two shards with slightly different chunk boundaries).
+    """
+    words = text.split()
+    if len(words) <= DEDUP_SHINGLE_SIZE:
+        return frozenset([hash(" ".join(words))])
+    hashes = {hash(" ".join(words[i:i + DEDUP_SHINGLE_SIZE])) for i in range(len(words) - DEDUP_SHINGLE_SIZE + 1)}
+    return frozenset(heapq.nsmallest(DEDUP_SKETCH_SIZE, hashes))
+
 def deduplicate_results(results: List[tuple]) -> List[tuple]:
     """
     Removes duplicate or highly similar chunks from results.
@@ -353,14 +547,34 @@ def deduplicate_results(results: List[tuple]) -> List[tuple]:
     
     unique_results = []
     seen_contents = set()
+    seen_sketches = []
+    seen_samples = []
     
     for doc, score in results:
-        # Create a hash of the ALL content to avoid false positives on boilerplate headers
+        # Exact duplicates: hash ALL content to avoid false positives on boilerplate headers
         content_hash = hash(doc.page_content)
+        if content_hash in seen_contents:
+            continue
         
-        if content_hash not in seen_contents:
-            seen_contents.add(content_hash)
-            unique_results.append((doc, score))
+        # Near duplicates: RapidFuzz token-sort similarity on a sample when installed,
+        # otherwise compare shingle sketches. (token_set_ratio scores any subset as 100,
+        # which would drop a shorter chunk whose words all appear in an earlier one.)
+        if fuzz is not None:
+            sample = doc.page_content[:DEDUP_SAMPLE_CHARS]
+            if seen_samples and fuzz_process.extractOne(
+                sample, seen_samples, scorer=fuzz.token_sort_ratio, score_cutoff=DEDUP_FUZZY_CUTOFF
+            ) is not None:
+                continue
+            seen_samples.append(sample)
+        else:
+            sketch = shingle_sketch(doc.page_content)
+            min_overlap = min(DEDUP_MIN_OVERLAP, len(sketch))
+            if any(len(sketch & seen) >= min_overlap for seen in seen_sketches):
+                continue
+            seen_sketches.append(sketch)
+        
+        seen_contents.add(content_hash)
+        unique_results.append((doc, score))
     
     return unique_results
 
@@ -368,21 +582,12 @@ def get_relevance_threshold(query_complexity: dict) -> float:
     """
     Determines relevance threshold based on query complexity.
     Lower threshold = more strict filtering
+    Uses the 'base_threshold' precomputed by analyze_query_complexity when present.
     """
-    thresholds = {
-        'simple': 1.2,      # Strict - we want exact matches
-        'complex': 1.8,     # More lenient - need broader context
-        'comparative': 2.0,  # Very lenient - need diverse sources
-        'procedural': 1.5   # Moderate - need step-by-step info
-    }
-    
-    base_threshold = thresholds.get(query_complexity['type'], 1.5)
-    
-    # Adjust based on confidence
-    if query_complexity['confidence'] < 0.6:
-        base_threshold += 0.3  # Be more lenient if uncertain
-    
-    return base_threshold
+    threshold = query_complexity.get('base_threshold')
+    if threshold is None:
+        threshold = _base_relevance_threshold(query_complexity['type'], query_complexity['confidence'])
+    return threshold
 
 def check_context_relevance(query: str, context: str, query_complexity: dict) -> dict:
     """
@@ -446,40 +651,50 @@ def check_context_relevance(query: str, context: str, query_complexity: dict) ->
         'missing_keywords': list(missing_keywords)
     }
 
-def verify_legal_citations(response: str, context: str) -> dict:
+# Patterns for legal citations
+_ARTICLE_RE = re.compile(r'Article\s+\d+[A-Za-z]?(?:\([^)]+\))?', re.IGNORECASE)
+_SECTION_RE = re.compile(r'Section\s+\d+[A-Za-z]?(?:\([^)]+\))?', re.IGNORECASE)
+_CHAPTER_RE = re.compile(r'Chapter\s+\d+[A-Za-z]?', re.IGNORECASE)
+
+def extract_context_citations(context: str) -> dict:
+    """
+    Builds lowercase lookup sets of the citations present in the context.
+    Done once before generation so the post-stream check is just set lookups.
+    """
+    return {
+        'articles': {c.lower() for c in _ARTICLE_RE.findall(context)},
+        'sections': {c.lower() for c in _SECTION_RE.findall(context)},
+        'chapters': {c.lower() for c in _CHAPTER_RE.findall(context)},
+    }
+
+def verify_legal_citations(response: str, context: str, context_citations: dict = None) -> dict:
     """
     Verifies that all legal citations in the response actually exist in the context.
     Detects hallucinated provisions to prevent misinformation.
+    Pass context_citations (from extract_context_citations) to skip re-scanning the context.
     Returns: {'valid': bool, 'violations': list, 'warning': str}
     """
     violations = []
     
-    # Patterns for legal citations
-    article_pattern = r'Article\s+\d+[A-Za-z]?(?:\([^)]+\))?'
-    section_pattern = r'Section\s+\d+[A-Za-z]?(?:\([^)]+\))?'
-    chapter_pattern = r'Chapter\s+\d+[A-Za-z]?'
+    if context_citations is None:
+        context_citations = extract_context_citations(context)
     
-    # Extract citations from response and context
-    response_articles = set(re.findall(article_pattern, response, re.IGNORECASE))
-    response_sections = set(re.findall(section_pattern, response, re.IGNORECASE))
-    response_chapters = set(re.findall(chapter_pattern, response, re.IGNORECASE))
+    # Extract citations from response
+    response_articles = set(_ARTICLE_RE.findall(response))
+    response_sections = set(_SECTION_RE.findall(response))
+    response_chapters = set(_CHAPTER_RE.findall(response))
     
-    context_articles = set(re.findall(article_pattern, context, re.IGNORECASE))
-    context_sections = set(re.findall(section_pattern, context, re.IGNORECASE))
-    context_chapters = set(re.findall(chapter_pattern, context, re.IGNORECASE))
-    
-    # Check for hallucinated citations
+    # Check for hallucinated citations (case-insensitive)
     for article in response_articles:
-        # Normalize for comparison (case-insensitive)
-        if not any(article.lower() == ctx.lower() for ctx in context_articles):
+        if article.lower() not in context_citations['articles']:
             violations.append(f"❌ HALLUCINATED: {article} cited but not found in context")
     
     for section in response_sections:
-        if not any(section.lower() == ctx.lower() for ctx in context_sections):
+        if section.lower() not in context_citations['sections']:
             violations.append(f"❌ HALLUCINATED: {section} cited but not found in context")
     
     for chapter in response_chapters:
-        if not any(chapter.lower() == ctx.lower() for ctx in context_chapters):
+        if chapter.lower() not in context_citations['chapters']:
             violations.append(f"❌ HALLUCINATED: {chapter} cited but not found in context")
     
     is_valid = len(violations) == 0
@@ -501,7 +716,7 @@ def verify_legal_citations(response: str, context: str) -> dict:
 
 
 
-def retrieve_context(query_text: str, n_results: int = 50, language: str = 'en', status_callback=None, persona: str = 'default', query_complexity: dict = None) -> List[tuple]:
+def retrieve_context(query_text: str, n_results: int = 50, language: str = 'en', status_callback=None, persona: str = 'default', query_complexity: dict = None, expanded_queries: List[str] = None) -> List[tuple]:
     """
     Reusable function to retrieve and rerank context for ANY purpose (Chat or Summary).
     Encapsulates: 
@@ -512,6 +727,9 @@ def retrieve_context(query_text: str, n_results: int = 50, language: str = 'en',
     - FlashRank Reranking
     - Adaptive Deep Search
     
+    expanded_queries: Expansions already generated by the caller. They are searched in
+    one batched pass instead of generating new ones; [] disables expansion.
+    
     Returns: List of (Document, score) tuples.
     """
     def send_status(msg):
@@ -538,19 +756,31 @@ def retrieve_context(query_text: str, n_results: int = 50, language: str = 'en',
     all_results = []
     skip_general_search = False
     
+    # Embed the query once; every shard search below reuses the vector instead of
+    # re-embedding the same text per shard
+    embedding_fn = core.get_embedding_function()
+    query_vector = embedding_fn.embed_query(effective_query)
+    
+    # Kick off LLM query expansion now so it overlaps with the index/vector searches below
+    needs_expansion = query_complexity['type'] in ['complex', 'comparative'] or persona != 'kira'
+    expansion_executor = None
+    expansion_future = None
+    if expanded_queries is not None:
+        needs_expansion = bool(expanded_queries)
+    elif needs_expansion:
+        expansion_executor = ThreadPoolExecutor(max_workers=1)
+        expansion_future = expansion_executor.submit(generate_query_expansions, effective_query, query_complexity)
+    
     # STRATEGY 0: EXACT SECTION LOOKUP (The "Map" Strategy)
     # Fixes hallucinations by prioritizing curated legal facts
     try:
-        sections_index_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sections_index.json')
-        if os.path.exists(sections_index_path):
-            with open(sections_index_path, 'r', encoding='utf-8') as f:
-                sections_map = json.load(f)
-                
+        sections_index = load_sections_index()
+        if sections_index:
             q_lower = effective_query.lower()
-            for entry in sections_map:
+            for entry, keywords in sections_index:
                 # Check all keywords
-                for kw in entry.get('keywords', []):
-                    if kw.lower() in q_lower:
+                for kw in keywords:
+                    if kw in q_lower:
                         print(f"🌟 EXACT MATCH FOUND: {entry['section']} - {entry['title']}")
                         send_status(f"🎯 Verified Match: {entry['section']} ({entry['act']})")
                         
@@ -567,6 +797,7 @@ def retrieve_context(query_text: str, n_results: int = 50, language: str = 'en',
                         # Append with unbeatable score (0.0 is best distance, or negative to force top?)
                         # We use score 0.00001 to ensure it survives reranking/sorting
                         all_results.append((exact_doc, 0.0)) 
+                        break  # One record per section is enough
     except Exception as e:
         print(f"Section Index Error: {e}")
 
@@ -615,7 +846,7 @@ def retrieve_context(query_text: str, n_results: int = 50, language: str = 'en',
                     else:
                          f_filter = {'filename': {'$in': target_filenames}}
                     try:
-                        return db.similarity_search_with_score(effective_query, k=10, filter=f_filter)
+                        return db.similarity_search_by_vector_with_relevance_scores(query_vector, k=10, filter=f_filter)
                     except Exception:
                         return []
 
@@ -642,7 +873,28 @@ def retrieve_context(query_text: str, n_results: int = 50, language: str = 'en',
     
     # Strategy 1: Direct similarity search
     def search_shard(db, k):
-        return db.similarity_search_with_score(effective_query, k=k)
+        return db.similarity_search_by_vector_with_relevance_scores(query_vector, k=k)
+
+    def search_queries_all_shards(queries, k):
+        """
+        Embeds all queries in one batched forward pass, then fans every
+        (query, shard) pair out on one shared pool so latency is max(), not sum().
+        """
+        results = []
+        if not queries:
+            return results
+        query_vectors = embedding_fn.embed_documents(list(queries))
+        with ThreadPoolExecutor(max_workers=min(len(queries) * len(dbs), 16)) as executor:
+            futures = [
+                executor.submit(db.similarity_search_by_vector_with_relevance_scores, vector, k=k)
+                for vector in query_vectors for db in dbs
+            ]
+            for future in as_completed(futures):
+                try:
+                    results.extend(future.result())
+                except Exception:
+                    pass
+        return results
     
     # Level 1: Initial direct search
     if not skip_general_search:
@@ -697,17 +949,12 @@ def retrieve_context(query_text: str, n_results: int = 50, language: str = 'en',
     # Strategy 2: Query Expansion
     # NOTE: For Summary pipeline, we might skip expansion if it's already an entity-based query.
     # But if query_complexity says 'complex', we do it.
-    if query_complexity['type'] in ['complex', 'comparative'] or persona != 'kira':
+    if needs_expansion:
         # send_status("🔄 Expanding queries...")
-        expanded_queries = generate_query_expansions(effective_query, query_complexity)
-        for exp_query in expanded_queries:
-            with ThreadPoolExecutor(max_workers=core.NUM_SHARDS) as executor:
-                futures = [executor.submit(lambda db: db.similarity_search_with_score(exp_query, k=min(current_k, 5)), db) for db in dbs]
-                for future in as_completed(futures):
-                    try:
-                        all_results.extend(future.result())
-                    except Exception:
-                        pass
+        if expansion_future is not None:
+            expanded_queries = expansion_future.result()
+            expansion_executor.shutdown(wait=False)
+        all_results.extend(search_queries_all_shards(expanded_queries, min(current_k, 5)))
 
     # Remove duplicates
     all_results = deduplicate_results(all_results)
@@ -742,15 +989,7 @@ def retrieve_context(query_text: str, n_results: int = 50, language: str = 'en',
             adaptive_queries.append(" ".join(broader_query_terms[:3]))
             adaptive_queries.append(" ".join(broader_query_terms[-3:]))
         
-        adaptive_results = []
-        for adapt_query in adaptive_queries:
-            with ThreadPoolExecutor(max_workers=core.NUM_SHARDS) as executor:
-                futures = [executor.submit(lambda db: db.similarity_search_with_score(adapt_query, k=5), db) for db in dbs]
-                for future in as_completed(futures):
-                    try:
-                        adaptive_results.extend(future.result())
-                    except Exception:
-                        pass
+        adaptive_results = search_queries_all_shards(adaptive_queries, 5)
         
         if adaptive_results:
             all_results.extend(adaptive_results)
@@ -771,16 +1010,6 @@ def query_docs(query_text: str, chat_history: List[dict] = [], n_results: int =
             status_callback(msg)
             
     try:
-        # Tag mapping for full names
-        tag_mapping = {
-            'ipc': 'Indian Penal Code (IPC)',
-            'bns': 'Bharatiya Nyaya Sanhita (BNS)',
-            'crpc': 'Criminal Procedure Code (CrPC)',
-            'bnss': 'Bharatiya Nagarik Suraksha Sanhita (BNSS)',
-            'iea': 'Indian Evidence Act (IEA)',
-            'bsa': 'Bharatiya Sakshya Adhiniyam (BSA)',
-        }
-        
         send_status("🧠 Analyzing query complexity...")
         
         # Adjust n_results for specific personas
@@ -824,18 +1053,22 @@ def query_docs(query_text: str, chat_history: List[dict] = [], n_results: int =
                  effective_query = query_text
             
             # If a category tag is selected, prepend it to help focus the search
-            if category_tag and category_tag in tag_mapping:
-                category_name = tag_mapping[category_tag]
+            if category_tag and category_tag in CATEGORY_TAG_MAPPING:
+                category_name = CATEGORY_TAG_MAPPING[category_tag]
                 effective_query = f"{category_name}: {effective_query}"
                 print(f"Query refined with tag '{category_tag}': {effective_query}")
             
             # Translate input to English if it's in Hindi (both 'hi' and 'hi-romanized' might have Hindi input)
             if language in ['hi', 'hi-romanized']:
                 try:
-                    send_status("🌐 Translating query to English...")
-                    # Translating query to English for retrieval
-                    translator = GoogleTranslator(source='auto', target='en')
-                    translated_query = translator.translate(effective_query)
+                    # Repeat queries skip the network round-trip
+                    translated_query = core.get_cached_translation(effective_query, 'en')
+                    if translated_query is None:
+                        send_status("🌐 Translating query to English...")
+                        # Translating query to English for retrieval
+                        translator = GoogleTranslator(source='auto', target='en')
+                        translated_query = translator.translate(effective_query)
+                        core.cache_translation(effective_query, 'en', translated_query)
                     print(f"Translated input query: '{query_text}' -> '{translated_query}'")
                     effective_query = translated_query
                     needs_input_translation = True
@@ -896,9 +1129,15 @@ def query_docs(query_text: str, chat_history: List[dict] = [], n_results: int =
                 msg = "मुझे अपलोड किए गए दस्तावेज़ों में कोई प्रासंगिक जानकारी नहीं मिली।"
             return iter([msg]), []
             
-        context_texts = [doc.page_content for doc, _ in top_results]
-        source_filenames = {doc.metadata['filename'] for doc, _ in top_results if 'filename' in doc.metadata}
-        context = "\n\n---\n\n".join(context_texts)
+        # Single pass over results for both context text and source filenames
+        context_parts = []
+        source_filenames = set()
+        for doc, _ in top_results:
+            context_parts.append(doc.page_content)
+            fn = doc.metadata.get('filename')
+            if fn:
+                source_filenames.add(fn)
+        context = "\n\n---\n\n".join(context_parts)
         
         # ChatML Prompt Construction for Qwen/Llama-Chat
         send_status("✍️ Generating final response...")
@@ -934,7 +1173,6 @@ RESPONSE STRUCTURE:
 1. Address their immediate question briefly
 2. Then ASK: clarifying questions OR offer to explore related aspects
 3. Keep responses conversational and invite continued dialogue
-3. Keep responses conversational and invite continued dialogue
 """
              prompt = f"<|im_start|>system\n{system_instruction}\nContext:\n{context}<|im_end|>\n"
         else:
@@ -951,23 +1189,12 @@ RESPONSE STRUCTURE:
                     filled_system_prompt = template.replace("{formatted_chunks}", context).replace("{query}", effective_query)
                     
                     # RESTORE LANGUAGE & CATEGORY INSTRUCTIONS
-                    if category_tag and category_tag in tag_mapping:
-                        category_name = tag_mapping[category_tag]
-                        filled_system_prompt += f"\nIMPORTANT: Focus specifically on information related to {category_name}.\n"
+                    filled_system_prompt += _CATEGORY_SUFFIX.get(category_tag, '')
                         
                     if language == 'hi':
-                        filled_system_prompt += """
-OUTPUT LANGUAGE REQUIREMENT:
-- You MUST respond in Hindi using Devanagari script (हिंदी में उत्तर दें).
-- Keep sentences short and clear.
-"""
+                        filled_system_prompt += _HI_SUFFIX
                     elif language == 'hi-romanized':
-                        filled_system_prompt += """
-OUTPUT LANGUAGE REQUIREMENT:
-- You MUST respond in "Romanized Hindi" (Hinglish).
-- Do not use Devanagari script.
-- Example: "IPC Section 302 ke tehat punishment..."
-"""
+                        filled_system_prompt += _HINGLISH_SUFFIX
                     
                     prompt = f"<|im_start|>system\n{filled_system_prompt}<|im_end|>\n"
                     
@@ -984,57 +1211,74 @@ Do not hallucinate citations.
 """
                 prompt = f"<|im_start|>system\n{system_instruction}\nContext:\n{context}<|im_end|>\n<|im_start|>user\n{effective_query}<|im_end|>\n"
         
+        # Assemble the ChatML turns in a list and join once
+        prompt_parts = [prompt]
         if chat_history:
             # For Kira's interactive mode, use more history for better conversational context
             history_count = 10 if persona == 'kira' else 6
-            for msg in chat_history[-history_count:]:
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
+            for msg in trim_history_by_tokens(chat_history, history_count):
                 # Note: History might be in Hindi if displayed in Hindi. 
                 # Ideally we translate it, but for speed we omit history translation for now 
                 # or rely on model to handle mixed context.
-                if role == 'user':
-                    prompt += f"<|im_start|>user\n{content}<|im_end|>\n"
-                else:
-                    prompt += f"<|im_start|>assistant\n{content}<|im_end|>\n"
+                role = 'user' if msg.get('role', 'user') == 'user' else 'assistant'
+                prompt_parts.append(f"<|im_start|>{role}\n{msg.get('content', '')}<|im_end|>\n")
         
         # Current turn (English) with SAFETY REMINDER
-        safety_reminder = "\n\n🚨 REMINDER: Check every legal citation against the context above. If a Section/Article is not listed verbatim in the context, DO NOT cite it."
-        final_query = effective_query + safety_reminder
-        
-        prompt += f"<|im_start|>user\n{final_query}<|im_end|>\n<|im_start|>assistant\n"
+        prompt_parts.append(f"<|im_start|>user\n{effective_query}{SAFETY_REMINDER}<|im_end|>\n<|im_start|>assistant\n")
+        prompt = "".join(prompt_parts)
 
         print("Generating answer stream with ChatML...")
         stream = core.safe_llm_stream(prompt, stop=["<|im_end|>"])
         
+        # Index context citations up front so verification after the stream is O(citations)
+        context_citations = extract_context_citations(context)
+        
+        def finalize_answer(full_text):
+            try:
+                # 🚨 VERIFY LEGAL CITATIONS - Check for hallucinations
+                verification = verify_legal_citations(full_text, context, context_citations)
+            
+                if not verification['valid']:
+                    print(f"⚠️  CITATION VERIFICATION FAILED:")
+                    for violation in verification['violations']:
+                        print(f"   {violation}")
+                    print(f"   📊 Stats: {verification['stats']}")
+                else:
+                    stats = verification['stats']
+                    if stats['articles_cited'] > 0 or stats['sections_cited'] > 0:
+                        print(f"✅ Citation verification passed: {stats['articles_cited']} articles, {stats['sections_cited']} sections verified")
+            
+                # Update Cache (only for English to keep cache simple)
+                if language == 'en':
+                    core.update_cache(effective_query, full_text, list(source_filenames))
+        
+            except Exception as e:
+                print(f"Post-answer processing failed: {e}")
+        
         # Wrapper to handle caching
         def response_wrapper():
-            full_answer_chunks = []
+            full_answer = io.StringIO()
             
-            # Stream the response directly (Qwen generates in the requested language)
+            # Stream the response (Qwen generates in the requested language),
+            # coalescing tiny token chunks into larger frames for the socket
+            buf = []
+            size = 0
+            last_flush = time.monotonic()
             for chunk in stream:
-                full_answer_chunks.append(chunk)
-                yield chunk
-            
-            # Full answer text (in whatever language Qwen generated)
-            full_text = "".join(full_answer_chunks)
-            
-            # 🚨 VERIFY LEGAL CITATIONS - Check for hallucinations
-            verification = verify_legal_citations(full_text, context)
-            
-            if not verification['valid']:
-                print(f"⚠️  CITATION VERIFICATION FAILED:")
-                for violation in verification['violations']:
-                    print(f"   {violation}")
-                print(f"   📊 Stats: {verification['stats']}")
-            else:
-                stats = verification['stats']
-                if stats['articles_cited'] > 0 or stats['sections_cited'] > 0:
-                    print(f"✅ Citation verification passed: {stats['articles_cited']} articles, {stats['sections_cited']} sections verified")
+                full_answer.write(chunk)
+                buf.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_FLUSH_CHARS or time.monotonic() - last_flush > STREAM_FLUSH_INTERVAL:
+                    yield "".join(buf)
+                    buf.clear()
+                    size = 0
+                    last_flush = time.monotonic()
+            if buf:
+                yield "".join(buf)
             
-            # Update Cache (only for English to keep cache simple)
-            if language == 'en':
-                core.update_cache(effective_query, full_text, list(source_filenames))
+            # Full answer text (in whatever language Qwen generated).
+            # Verification and the cache write (a disk save) run off the stream so it ends immediately.
+            _post_answer_executor.submit(finalize_answer, full_answer.getvalue())
             
         return response_wrapper(), list(source_filenames)
         
@@ -8,13 +8,17 @@ This module implements Phase A of the refined Smart Legal RAG System:
 4. Dual Storage (Vector DB + JSON Map)
 """
 
+import io
 import re
-import json
+import bisect
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime
 import hashlib
+import uuid
 
 try:
     from langchain_core.documents import Document
@@ -63,7 +67,39 @@ class EnrichedSection:
 # STEP 1: STRUCTURAL SEGMENTATION (Atomic Split)
 # ============================================================================
 
-def extract_sections_from_text(text: str, filename: str = "", act_name: str = "UNKNOWN") -> List[SectionCandidate]:
+# Primary regex for Section/Article headers
+# Matches: "Section 304.", "Article 21", "Sec 103A", etc.
+SECTION_HEADER_PATTERN = re.compile(
+    r'(?m)^(?:Section|Article|Sec\.?)\s*(\d+[A-Z]*)\s*\.?\s*[:\-\–]?\s*(.+?)$',
+    re.IGNORECASE
+)
+
+# Sub-clause markers like (1), (2), (a), (b), etc.
+SUBCLAUSE_PATTERN = re.compile(r'\n\s*\(([0-9a-z]+)\)\s+')
+
+def iter_match_spans(pattern: re.Pattern, text: str):
+    """
+    Single streaming pass over the header matches of `pattern`.
+    
+    Holds only the previous match (no list of all matches) and yields it once
+    the next header shows where its body ends.
+    
+    Returns: Generator of (match, body_end) tuples; the body is text[match.end():body_end]
+    """
+    prev_match = None
+    for match in pattern.finditer(text):
+        if prev_match is not None:
+            yield prev_match, match.start()
+        prev_match = match
+    if prev_match is not None:
+        yield prev_match, len(text)
+
+def extract_sections_from_text(
+    text: str,
+    filename: str = "",
+    act_name: str = "UNKNOWN",
+    page_starts: Optional[List[int]] = None
+) -> List[SectionCandidate]:
     """
     Splits document using Legal Boundaries instead of character counts.
     
@@ -73,42 +109,28 @@ def extract_sections_from_text(text: str, filename: str = "", act_name: str = "U
         - Capture Body (Text up to next section)
         - Apply Sub-clause Splitter if section > 6000 chars
     
+    page_starts: Sorted text offsets where each page begins (page 1 first). When given,
+    section pages are exact; otherwise they are estimated at 3000 chars per page.
+    
     Returns: List of SectionCandidate objects
     """
     
-    # Primary regex for Section/Article headers
-    # Matches: "Section 304.", "Article 21", "Sec 103A", etc.
-    section_pattern = re.compile(
-        r'(?m)^(?:Section|Article|Sec\.?)\s*(\d+[A-Z]*)\s*\.?\s*[:\-\–]?\s*(.+?)$',
-        re.IGNORECASE
-    )
-    
     candidates = []
-    matches = list(section_pattern.finditer(text))
     
-    if not matches:
-        print(f"No sections found in {filename}. Treating as single document.")
-        # Return entire document as one chunk
-        return [SectionCandidate(
-            section_id="FULL_DOC",
-            title=filename,
-            body=text[:6000],  # Limit to reasonable size
-            page=1,
-            act=act_name,
-            subsections=[]
-        )]
-    
-    for i, match in enumerate(matches):
+    for match, end_pos in iter_match_spans(SECTION_HEADER_PATTERN, text):
         section_id = match.group(1).strip()
         title = match.group(2).strip()
         
         # Extract body: from current match end to next match start (or end of text)
         start_pos = match.end()
-        end_pos = matches[i + 1].start() if i + 1 < len(matches) else len(text)
         body = text[start_pos:end_pos].strip()
         
-        # Estimate page number (rough calculation: 3000 chars per page)
-        page = (match.start() // 3000) + 1
+        if page_starts:
+            # Number of pages starting at or before the header = its 1-based page
+            page = max(bisect.bisect_right(page_starts, match.start()), 1)
+        else:
+            # Estimate page number (rough calculation: 3000 chars per page)
+            page = (match.start() // 3000) + 1
         
         # Check if section is too large (> 6000 chars)
         if len(body) > 6000:
@@ -135,6 +157,18 @@ def extract_sections_from_text(text: str, filename: str = "", act_name: str = "U
                 subsections=[]
             ))
     
+    if not candidates:
+        print(f"No sections found in {filename}. Treating as single document.")
+        # Return entire document as one chunk
+        return [SectionCandidate(
+            section_id="FULL_DOC",
+            title=filename,
+            body=text[:6000],  # Limit to reasonable size
+            page=1,
+            act=act_name,
+            subsections=[]
+        )]
+    
     print(f"✓ Extracted {len(candidates)} sections from {filename}")
     return candidates
 
@@ -146,26 +180,27 @@ def split_into_subclauses(text: str, parent_id: str) -> List[Tuple[str, str]]:
     
     Returns: List of (sub_id, text) tuples
     """
-    # Match patterns like (1), (2), (a), (b), etc.
-    subclause_pattern = re.compile(r'\n\s*\(([0-9a-z]+)\)\s+')
-    
-    matches = list(subclause_pattern.finditer(text))
-    
-    if not matches:
-        # No sub-clauses found, split by character limit
-        chunks = []
-        for i in range(0, len(text), 5000):
-            chunks.append((f"P{i//5000 + 1}", text[i:i+5000]))
-        return chunks
-    
     subclauses = []
-    for i, match in enumerate(matches):
+    for match, end in iter_match_spans(SUBCLAUSE_PATTERN, text):
         sub_id = match.group(1)
-        start = match.end()
-        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
-        sub_text = text[start:end].strip()
+        sub_text = text[match.end():end].strip()
         subclauses.append((sub_id, sub_text))
     
+    if not subclauses:
+        # No sub-clauses found, split by character limit, snapping each cut back
+        # to the last newline in the window so lines aren't chopped mid-sentence
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = min(start + 5000, len(text))
+            if end < len(text):
+                newline = text.rfind('\n', start + 2500, end)
+                if newline != -1:
+                    end = newline + 1
+            chunks.append((f"P{len(chunks) + 1}", text[start:end]))
+            start = end
+        return chunks
+    
     return subclauses
 
 
@@ -173,6 +208,94 @@ def split_into_subclauses(text: str, parent_id: str) -> List[Tuple[str, str]]:
 # STEP 2: SEMANTIC ENRICHMENT (The "Translator")
 # ============================================================================
 
+# LLM metadata cached by section content, so re-uploading the same Act skips the LLM
+ENRICHMENT_CACHE_FILE = os.path.join(core.BASE_DIR, "enrichment_cache.json")
+_enrichment_cache = None
+_enrichment_cache_lock = threading.Lock()
+
+def enrichment_cache_key(section: SectionCandidate) -> str:
+    """Content key for a section: same ID, title and text → same LLM metadata."""
+    raw = f"{section.section_id}\n{section.title}\n{section.body}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+def _get_enrichment_cache() -> Dict[str, Dict[str, Any]]:
+    global _enrichment_cache
+    if _enrichment_cache is None:
+        with _enrichment_cache_lock:
+            if _enrichment_cache is None:
+                cache = {}
+                if os.path.exists(ENRICHMENT_CACHE_FILE):
+                    try:
+                        cache = core.read_json_file(ENRICHMENT_CACHE_FILE)
+                    except Exception as e:
+                        print(f"⚠ Enrichment cache load failed: {e}")
+                _enrichment_cache = cache
+    return _enrichment_cache
+
+def get_cached_enrichment(section: SectionCandidate) -> Optional[Dict[str, Any]]:
+    return _get_enrichment_cache().get(enrichment_cache_key(section))
+
+def cache_enrichment(section: SectionCandidate, metadata: Dict[str, Any]):
+    """Records LLM metadata for a section (in memory; persisted by save_enrichment_cache)."""
+    cache = _get_enrichment_cache()
+    with _enrichment_cache_lock:
+        cache[enrichment_cache_key(section)] = {
+            "type": metadata.get("type", "PROCEDURAL"),
+            "human_keywords": metadata.get("human_keywords", [section.title.lower()])[:5],
+            "summary": metadata.get("summary", section.title),
+            "severity": metadata.get("severity", "N/A"),
+            "bailable": metadata.get("bailable", "N/A")
+        }
+
+def save_enrichment_cache():
+    cache = _get_enrichment_cache()
+    with _enrichment_cache_lock:
+        cache_copy = cache.copy()
+    try:
+        core.write_json_file(ENRICHMENT_CACHE_FILE, cache_copy)
+    except Exception as e:
+        print(f"⚠ Enrichment cache save failed: {e}")
+
+def enriched_from_metadata(section: SectionCandidate, metadata: Dict[str, Any]) -> EnrichedSection:
+    return EnrichedSection(
+        section_id=section.section_id,
+        title=section.title,
+        body=section.body,
+        page=section.page,
+        act=section.act,
+        common_crime_name=metadata["type"],
+        human_keywords=list(metadata["human_keywords"]),
+        summary=metadata["summary"],
+        severity=metadata["severity"],
+        bailable=metadata["bailable"]
+    )
+
+# Schema of one section's metadata, enforced at decode time when llama.cpp supports it
+ENRICHMENT_METADATA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"enum": ["PENAL", "PROCEDURAL"]},
+        "human_keywords": {"type": "array", "items": {"type": "string"}, "maxItems": 5},
+        "summary": {"type": "string"},
+        "severity": {"enum": ["Cognizable", "Non-Cognizable", "N/A"]},
+        "bailable": {"enum": ["Yes", "No", "Depends", "N/A"]}
+    },
+    "required": ["type", "human_keywords", "summary", "severity", "bailable"]
+}
+
+
+def enrichment_grammar_kwargs(count: Optional[int] = None) -> Dict[str, Any]:
+    """
+    LLM kwargs constraining output to one metadata object, or to an array of
+    exactly `count` of them. Empty if grammar-constrained decoding is unavailable.
+    """
+    schema = ENRICHMENT_METADATA_SCHEMA
+    if count is not None:
+        schema = {"type": "array", "items": schema, "minItems": count, "maxItems": count}
+    grammar = core.get_json_grammar(schema)
+    return {"grammar": grammar} if grammar is not None else {}
+
+
 def enrich_section_with_llm(section: SectionCandidate) -> EnrichedSection:
     """
     Passes section through Qwen to generate metadata.
@@ -187,6 +310,10 @@ def enrich_section_with_llm(section: SectionCandidate) -> EnrichedSection:
     Returns: EnrichedSection object
     """
     
+    cached = get_cached_enrichment(section)
+    if cached is not None:
+        return enriched_from_metadata(section, cached)
+    
     prompt = f"""You are a legal metadata extractor. Analyze this legal provision and return ONLY a valid JSON object.
 
 LEGAL TEXT:
@@ -215,13 +342,12 @@ IMPORTANT:
 
     try:
         # Use LLM to generate metadata
-        response = core.safe_llm_invoke(prompt, max_tokens=300, temperature=0.3)
-        
-        # Parse JSON response
-        # Clean potential markdown code blocks
-        response = response.replace("```json", "").replace("```", "").strip()
+        response = core.safe_llm_invoke(
+            prompt, max_tokens=300, temperature=0.3, **enrichment_grammar_kwargs()
+        )
         
-        metadata = json.loads(response)
+        # Parse JSON response (ignores markdown code fences and surrounding prose)
+        metadata = core.extract_json(response)
         
         # Validate required fields
         required = ["type", "human_keywords", "summary", "severity", "bailable"]
@@ -229,6 +355,8 @@ IMPORTANT:
             if field not in metadata:
                 raise ValueError(f"Missing field: {field}")
         
+        cache_enrichment(section, metadata)
+        
         return EnrichedSection(
             section_id=section.section_id,
             title=section.title,
@@ -261,6 +389,50 @@ IMPORTANT:
         )
 
 
+# Static part of the batch enrichment prompt (kept byte-identical across calls)
+BATCH_ENRICHMENT_INSTRUCTIONS = """You are a legal metadata extractor. Analyze the legal provisions below and return a JSON ARRAY.
+
+INSTRUCTIONS:
+Return a JSON array with one object per section, each with these exact keys:
+[
+  {
+    "type": "PENAL" or "PROCEDURAL",
+    "human_keywords": ["keyword1", "keyword2", "keyword3", "keyword4", "keyword5"],
+    "summary": "One sentence simple English explanation",
+    "severity": "Cognizable/Non-Cognizable/N/A",
+    "bailable": "Yes/No/Depends/N/A"
+  }
+]
+
+RULES:
+- Use "PENAL" for crimes/punishments, "PROCEDURAL" for processes/definitions
+- Maintain the same order as the sections
+- Return ONLY the JSON array, no explanations
+"""
+
+# Generation budget per section's metadata object
+ENRICHMENT_TOKENS_PER_SECTION = 180
+
+def parse_batch_enrichment(response: str, expected: int) -> List[Dict[str, Any]]:
+    """
+    Parses a batch enrichment response into one metadata dict per section.
+    Markdown code fences and surrounding prose are ignored.
+    
+    Raises:
+        ValueError: If the response is not a JSON array of `expected` objects.
+    """
+    metadata_list = core.extract_json(response)
+    
+    if not isinstance(metadata_list, list):
+        raise ValueError("LLM did not return an array")
+    if len(metadata_list) < expected:
+        raise ValueError(f"expected {expected} objects, got {len(metadata_list)}")
+    if not all(isinstance(metadata, dict) for metadata in metadata_list[:expected]):
+        raise ValueError("array items must be JSON objects")
+    
+    return metadata_list[:expected]
+
+
 def enrich_sections_batch(sections: List[SectionCandidate], batch_size: int = 5) -> List[EnrichedSection]:
     """
     FAST BATCH ENRICHMENT - Processes multiple sections in a single LLM call.
@@ -278,57 +450,63 @@ def enrich_sections_batch(sections: List[SectionCandidate], batch_size: int = 5)
         List of EnrichedSection objects
     """
     
-    enriched_results = []
+    enriched_results = [None] * len(sections)
+    
+    # Serve previously enriched sections from the cache; only the rest go to the LLM
+    pending = []
+    for i, section in enumerate(sections):
+        cached = get_cached_enrichment(section)
+        if cached is not None:
+            enriched_results[i] = enriched_from_metadata(section, cached)
+        else:
+            pending.append(i)
+    
+    if len(pending) < len(sections):
+        print(f"⚡ {len(sections) - len(pending)} sections served from enrichment cache")
     
     # Process in batches
-    for batch_start in range(0, len(sections), batch_size):
-        batch = sections[batch_start:batch_start + batch_size]
-        
-        # Build batch prompt
-        sections_text = ""
-        for idx, section in enumerate(batch):
-            sections_text += f"""
---- SECTION {idx + 1} ---
-ID: {section.section_id}
-Title: {section.title}
-Content: {section.body[:800]}
-
-"""
+    for batch_start in range(0, len(pending), batch_size):
+        batch_indices = pending[batch_start:batch_start + batch_size]
+        batch = [sections[i] for i in batch_indices]
+        
+        # Build batch prompt: the constant instructions come first so llama.cpp can
+        # reuse their KV cache from the previous batch and only prefill the sections
+        sections_text = "".join(
+            f"--- SECTION {idx + 1} ---\n"
+            f"ID: {section.section_id}\n"
+            f"Title: {section.title}\n"
+            f"Content: {section.body[:800]}\n\n"
+            for idx, section in enumerate(batch)
+        )
         
-        prompt = f"""You are a legal metadata extractor. Analyze these {len(batch)} legal provisions and return a JSON ARRAY.
-
-{sections_text}
-
-INSTRUCTIONS:
-Return a JSON array with {len(batch)} objects, each with these exact keys:
-[
-  {{
-    "type": "PENAL" or "PROCEDURAL",
-    "human_keywords": ["keyword1", "keyword2", "keyword3", "keyword4", "keyword5"],
-    "summary": "One sentence simple English explanation",
-    "severity": "Cognizable/Non-Cognizable/N/A",
-    "bailable": "Yes/No/Depends/N/A"
-  }}
-]
-
-RULES:
-- Use "PENAL" for crimes/punishments, "PROCEDURAL" for processes/definitions
-- Maintain the same order as the sections above
-- Return ONLY the JSON array, no explanations
-
-"""
+        prompt = (
+            f"{BATCH_ENRICHMENT_INSTRUCTIONS}\n"
+            f"{sections_text}"
+            f"Return the JSON array with exactly {len(batch)} objects now:\n"
+        )
         
         try:
-            # Single LLM call for entire batch
-            response = core.safe_llm_invoke(prompt, max_tokens=800, temperature=0.3)
-            response = response.replace("```json", "").replace("```", "").strip()
-            
-            # Parse batch results
-            metadata_list = json.loads(response)
+            # Single LLM call for entire batch; output budget scales with the batch
+            response = core.safe_llm_invoke(
+                prompt,
+                max_tokens=min(800, ENRICHMENT_TOKENS_PER_SECTION * len(batch)),
+                temperature=0.3,
+                **enrichment_grammar_kwargs(len(batch))
+            )
             
-            # Validate it's a list
-            if not isinstance(metadata_list, list):
-                raise ValueError("LLM did not return an array")
+            try:
+                metadata_list = parse_batch_enrichment(response, len(batch))
+            except ValueError as e:
+                # One corrective retry is far cheaper than enriching each section alone
+                print(f"⚠ Malformed batch response ({e}), retrying once...")
+                response = core.safe_llm_invoke(
+                    f"{prompt}\nYour previous response was malformed: {e}\n"
+                    f"Return ONLY the JSON array with exactly {len(batch)} objects:\n",
+                    max_tokens=min(800, ENRICHMENT_TOKENS_PER_SECTION * len(batch)),
+                    temperature=0.0,
+                    **enrichment_grammar_kwargs(len(batch))
+                )
+                metadata_list = parse_batch_enrichment(response, len(batch))
             
             # Map results back to sections
             for idx, (section, metadata) in enumerate(zip(batch, metadata_list)):
@@ -345,11 +523,12 @@ RULES:
                         severity=metadata.get("severity", "N/A"),
                         bailable=metadata.get("bailable", "N/A")
                     )
-                    enriched_results.append(enriched)
+                    enriched_results[batch_indices[idx]] = enriched
+                    cache_enrichment(section, metadata)
                 except Exception as e:
                     print(f"⚠ Failed to process section {section.section_id}: {e}")
                     # Fallback enrichment
-                    enriched_results.append(EnrichedSection(
+                    enriched_results[batch_indices[idx]] = EnrichedSection(
                         section_id=section.section_id,
                         title=section.title,
                         body=section.body,
@@ -360,15 +539,18 @@ RULES:
                         summary=section.title,
                         severity="N/A",
                         bailable="N/A"
-                    ))
+                    )
                     
         except Exception as e:
             print(f"⚠ Batch enrichment failed: {e}")
             print(f"Response: {response[:300] if 'response' in locals() else 'No response'}")
             
             # Fallback: use individual enrichment for this batch
-            for section in batch:
-                enriched_results.append(enrich_section_with_llm(section))
+            for i, section in zip(batch_indices, batch):
+                enriched_results[i] = enrich_section_with_llm(section)
+    
+    if pending:
+        save_enrichment_cache()
     
     return enriched_results
 
@@ -418,42 +600,72 @@ def construct_rich_chunk(enriched: EnrichedSection) -> Document:
 # STEP 4: DUAL STORAGE COMMITMENT
 # ============================================================================
 
-def store_to_vector_db(documents: List[Document]) -> List[str]:
+# Chunks per add_documents call when writing to a vector shard
+VECTOR_STORE_BATCH_SIZE = 32
+
+def store_to_vector_db(
+    documents: List[Document],
+    enriched_sections: Optional[List[EnrichedSection]] = None,
+    status_callback=None
+) -> List[str]:
     """
-    Stores Rich Chunks to ChromaDB.
-    Returns list of UUIDs for each stored document.
+    Stores Rich Chunks to ChromaDB, round-robin across the vector shards in
+    batches of VECTOR_STORE_BATCH_SIZE. Shared by every ingest pipeline.
+    
+    If enriched_sections is given (parallel to documents), each section's
+    chroma_uuid is set to the UUID of its stored chunk ("" if its batch failed).
+    
+    Returns:
+        List of UUIDs for each stored document, in shard order.
     """
+    log = status_callback or print
     try:
         dbs = core.get_dbs()
         all_uuids = []
-        
-        # Distribute across shards
-        shard_docs = [[] for _ in range(core.NUM_SHARDS)]
-        for i, doc in enumerate(documents):
-            shard_idx = i % core.NUM_SHARDS
-            shard_docs[shard_idx].append(doc)
-        
-        # Store in batches
-        BATCH_SIZE = 32
-        for shard_idx, docs in enumerate(shard_docs):
-            if not docs:
-                continue
-                
-            print(f"  Storing {len(docs)} chunks to shard {shard_idx}...")
+        if enriched_sections is None:
+            enriched_sections = [None] * len(documents)
+        
+        # Distribute across shards (documents paired with their sections)
+        shard_pairs = [[] for _ in range(core.NUM_SHARDS)]
+        for i, pair in enumerate(zip(documents, enriched_sections)):
+            shard_pairs[i % core.NUM_SHARDS].append(pair)
+        
+        def store_shard(shard_idx):
+            pairs = shard_pairs[shard_idx]
+            shard_uuids = []
+            log(f"  Storing {len(pairs)} chunks to shard {shard_idx}...")
             
-            for j in range(0, len(docs), BATCH_SIZE):
-                batch = docs[j:j + BATCH_SIZE]
+            for j in range(0, len(pairs), VECTOR_STORE_BATCH_SIZE):
+                batch = pairs[j:j + VECTOR_STORE_BATCH_SIZE]
+                batch_docs = [doc for doc, _ in batch]
+                # Pre-generate UUIDs so sections are linked without reading them back
+                ids = [str(uuid.uuid4()) for _ in batch]
                 try:
-                    ids = dbs[shard_idx].add_documents(batch)
-                    all_uuids.extend(ids)
+                    dbs[shard_idx].add_documents(batch_docs, ids=ids)
+                    shard_uuids.extend(ids)
                 except Exception as e:
-                    print(f"  ✗ Batch {j//BATCH_SIZE + 1} failed: {e}")
-        
-        print(f"✓ Stored {len(all_uuids)} documents to Vector DB")
+                    log(f"  ✗ Shard {shard_idx} batch {j//VECTOR_STORE_BATCH_SIZE + 1} failed: {e}")
+                    ids = [""] * len(batch)
+                
+                # Link UUIDs to enriched sections
+                for (_, enriched), doc_id in zip(batch, ids):
+                    if enriched is not None:
+                        enriched.chroma_uuid = doc_id
+            return shard_uuids
+        
+        # One thread per shard. Embedding is serialized by core.embedding_lock,
+        # so what overlaps is the Chroma writes to the independent shards.
+        active_shards = [i for i, pairs in enumerate(shard_pairs) if pairs]
+        if active_shards:
+            with ThreadPoolExecutor(max_workers=len(active_shards)) as executor:
+                for shard_uuids in executor.map(store_shard, active_shards):
+                    all_uuids.extend(shard_uuids)
+        
+        log(f"✓ Stored {len(all_uuids)} documents to Vector DB")
         return all_uuids
         
     except Exception as e:
-        print(f"✗ Vector DB storage failed: {e}")
+        log(f"✗ Vector DB storage failed: {e}")
         return []
 
 
@@ -484,14 +696,6 @@ def store_to_json_map(enriched_sections: List[EnrichedSection], filename: str, a
     
     DB_FILE = "uploads_db.json"
     
-    # Load existing database
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            db = json.loads(content) if content else {"documents": {}}
-    else:
-        db = {"documents": {}}
-    
     # Generate global summary
     global_summary = f"{act_name} - Contains {len(enriched_sections)} legal provisions"
     
@@ -524,12 +728,15 @@ def store_to_json_map(enriched_sections: List[EnrichedSection], filename: str, a
         "sections_map": sections_map  # Array of section objects (not a dict)
     }
     
-    # Update database
-    db["documents"][file_id] = document_entry
-    
-    # Save to file
-    with open(DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(db, f, indent=2, ensure_ascii=False)
+    # Read-modify-write under the lock; the entry above is built outside it
+    with core.json_file_lock(DB_FILE):
+        if os.path.exists(DB_FILE) and os.path.getsize(DB_FILE) > 0:
+            db = core.read_json_file(DB_FILE)
+        else:
+            db = {"documents": {}}
+        
+        db["documents"][file_id] = document_entry
+        core.write_json_file(DB_FILE, db, indent=True)
     
     print(f"✓ Updated JSON Map: {filename} → {len(sections_map)} sections")
     return document_entry
@@ -581,12 +788,22 @@ def process_legal_document(
         from langchain_community.document_loaders import PyPDFLoader
         
         loader = PyPDFLoader(file_path)
-        pages = loader.load()
-        full_text = "\n".join([page.page_content for page in pages])
+        # Stream pages into one buffer instead of holding every page Document for a join
+        buffer = io.StringIO()
+        page_starts = []  # Text offset of each page, for exact section page numbers
+        offset = 0
+        for i, page in enumerate(loader.lazy_load()):
+            if i:
+                buffer.write("\n")
+                offset += 1
+            page_starts.append(offset)
+            buffer.write(page.page_content)
+            offset += len(page.page_content)
+        full_text = buffer.getvalue()
         
         # Step 2: Structural Segmentation
         send_status(f"⚡ Applying Atomic Segmentation (Legal Boundaries)...")
-        section_candidates = extract_sections_from_text(full_text, filename, act_name)
+        section_candidates = extract_sections_from_text(full_text, filename, act_name, page_starts)
         
         send_status(f"✓ Extracted {len(section_candidates)} sections")
         
@@ -604,55 +821,12 @@ def process_legal_document(
         
         # Step 2: Construct all rich chunks
         send_status("🔨 Building vector chunks...")
-        rich_documents = []
-        for enriched in enriched_sections:
-            rich_doc = construct_rich_chunk(enriched)
-            rich_documents.append(rich_doc)
+        rich_documents = [construct_rich_chunk(enriched) for enriched in enriched_sections]
         send_status(f"✓ Built {len(rich_documents)} rich chunks")
         
         # Step 3: BATCH STORAGE with UUID capture
         send_status("💾 Storing to Vector DB in optimized batches...")
-        dbs = core.get_dbs()
-        
-        # Distribute across shards
-        shard_docs = [[] for _ in range(core.NUM_SHARDS)]
-        shard_enriched = [[] for _ in range(core.NUM_SHARDS)]
-        
-        for i, (doc, enriched) in enumerate(zip(rich_documents, enriched_sections)):
-            shard_idx = i % core.NUM_SHARDS
-            shard_docs[shard_idx].append(doc)
-            shard_enriched[shard_idx].append(enriched)
-        
-        # Store in batches per shard and capture UUIDs
-        BATCH_SIZE = 32
-        for shard_idx in range(core.NUM_SHARDS):
-            if not shard_docs[shard_idx]:
-                continue
-                
-            docs = shard_docs[shard_idx]
-            enriched_list = shard_enriched[shard_idx]
-            
-            send_status(f"  Shard {shard_idx}: Storing {len(docs)} documents...")
-            
-            for batch_start in range(0, len(docs), BATCH_SIZE):
-                batch_docs = docs[batch_start:batch_start + BATCH_SIZE]
-                batch_enriched = enriched_list[batch_start:batch_start + BATCH_SIZE]
-                
-                try:
-                    # Store batch and get UUIDs
-                    doc_ids = dbs[shard_idx].add_documents(batch_docs)
-                    
-                    # Link UUIDs to enriched sections
-                    for enriched, uuid in zip(batch_enriched, doc_ids):
-                        enriched.chroma_uuid = uuid
-                        
-                    send_status(f"     ✓ Batch {batch_start//BATCH_SIZE + 1}: {len(doc_ids)} UUIDs captured")
-                    
-                except Exception as e:
-                    send_status(f"     ✗ Batch storage failed: {e}")
-                    # Set empty UUIDs on failure
-                    for enriched in batch_enriched:
-                        enriched.chroma_uuid = ""
+        store_to_vector_db(rich_documents, enriched_sections, status_callback=send_status)
         
         send_status(f"✓ Stored {len(enriched_sections)} sections with UUID tracking")
         
@@ -690,6 +864,30 @@ def process_legal_document(
 # UTILITY FUNCTIONS
 # ============================================================================
 
+# Keyword → Act name, in priority order: when a filename names several Acts
+# (e.g. "IPC_BNS_Mapping.pdf"), the earliest entry wins. Matched as one
+# alternation, longest keyword first, so "bnss" is never shadowed by "bns".
+ACT_NAME_KEYWORDS = {
+    'bns': 'BNS',
+    'bharatiya nyaya sanhita': 'BNS',
+    'ipc': 'IPC',
+    'indian penal code': 'IPC',
+    'crpc': 'CrPC',
+    'code of criminal procedure': 'CrPC',
+    'bnss': 'BNSS',
+    'bharatiya nagarik suraksha sanhita': 'BNSS',
+    'bsa': 'BSA',
+    'bharatiya sakshya adhiniyam': 'BSA',
+    'evidence act': 'IEA',
+    'iea': 'IEA'
+}
+
+ACT_NAME_PATTERN = re.compile(
+    '|'.join(re.escape(k) for k in sorted(ACT_NAME_KEYWORDS, key=len, reverse=True))
+)
+ACT_NAME_PRIORITY = {keyword: rank for rank, keyword in enumerate(ACT_NAME_KEYWORDS)}
+
+
 def detect_act_name(filename: str) -> str:
     """
     Attempts to detect the Act name from filename.
@@ -700,26 +898,11 @@ def detect_act_name(filename: str) -> str:
         "bharatiya_nyaya_sanhita.pdf" → "BNS"
     """
     
-    filename_lower = filename.lower()
-    
-    # Mapping of keywords to Act names
-    act_mappings = {
-        'bns': 'BNS',
-        'bharatiya nyaya sanhita': 'BNS',
-        'ipc': 'IPC',
-        'indian penal code': 'IPC',
-        'crpc': 'CrPC',
-        'code of criminal procedure': 'CrPC',
-        'bnss': 'BNSS',
-        'bharatiya nagarik suraksha sanhita': 'BNSS',
-        'bsa': 'BSA',
-        'bharatiya sakshya adhiniyam': 'BSA',
-        'evidence act': 'IEA',
-        'iea': 'IEA'
-    }
+    # Treat underscores/hyphens as spaces so multi-word keywords match filenames
+    filename_lower = re.sub(r'[_\-]+', ' ', filename.lower())
     
-    for keyword, act in act_mappings.items():
-        if keyword in filename_lower:
-            return act
+    matches = ACT_NAME_PATTERN.findall(filename_lower)
+    if matches:
+        return ACT_NAME_KEYWORDS[min(matches, key=ACT_NAME_PRIORITY.__getitem__)]
     
     return "UNKNOWN"
@@ -11,11 +11,70 @@ This module implements Phase B of the refined Smart Legal RAG System:
 import re
 import json
 import os
+import time
+import queue
+import threading
+import contextvars
+import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 
+try:
+    import re2  # google-re2: linear-time DFA matching for query classification patterns
+except ImportError:
+    re2 = None
+
 import core
 
 
+# Section/Article reference in a user query, e.g. "Section 304", "Art. 21", "sec 103A".
+# Further query classifiers belong in this alternation as named groups, not extra passes.
+_query_re = re2 if re2 is not None else re
+SECTION_QUERY_PATTERN = _query_re.compile(
+    r'(?i)(?:(?P<section>Section|Sec\.?)|(?P<article>Article|Art\.?))\s*(?P<id>\d+[A-Z]*)'
+)
+
+# Markdown code fences around LLM JSON output
+JSON_FENCE_PATTERN = re.compile(r'```(?:json)?', re.IGNORECASE)
+JSON_STRING_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+# Fixed preamble of every Deep Path answer prompt
+GROUNDED_ANSWER_RULES = """You are Kira, a legal AI assistant. Answer the user's question using ONLY the provided context.
+
+CRITICAL RULES:
+1. **CITE EXPLICITLY**: Always mention Section numbers and Act names (e.g., "Section 304 of BNS")
+2. **NO HALLUCINATION**: If the context doesn't contain the answer, say "I don't have information about that in the uploaded documents."
+3. **DISTINGUISH**: Clearly separate "Definition" vs "Punishment" when both are present
+4. **NATURAL TONE**: Be conversational but precise"""
+
+# Markdown card for a Fast Path hit (filled from a fast_lookup result)
+FAST_RESPONSE_TEMPLATE = """### 📋 Section {section_id}: {title}
+
+**Summary:** {summary}
+
+**Legal Details:**
+- **Severity:** {severity}
+- **Bailable:** {bailable}
+- **Crime Category:** {crime}
+
+**Source:** {act} (Page {page})
+
+**Related Keywords:** {keywords_str}
+
+---
+
+*This information was retrieved instantly from {filename}*"""
+
+# Deep Path semantic cache: paraphrases of a recent question reuse its grounded answer
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_TTL_SECONDS = 3600
+SEMANTIC_CACHE_MAX_ENTRIES = 256
+
+# JSON Map (Fast Brain) written by the ingestion pipelines
+UPLOADS_DB_FILE = "uploads_db.json"
+
+GENERATION_ERROR_RESPONSE = "I encountered an error while processing your request. Please try again."
+
+
 # ============================================================================
 # PHASE B: SMART RETRIEVAL LOGIC
 # ============================================================================
@@ -26,21 +85,72 @@ class QueryRouter:
     """
     
     def __init__(self):
+        # retrieval imports this module at load time, so resolve it here, once, not at module top
+        from retrieval import retrieve_context
+        self.retrieve_context = retrieve_context
+        
+        self.db_signature = self.uploads_db_signature()
         self.uploads_db = self.load_uploads_db()
+        self.section_index = self.build_section_index(self.uploads_db)
+        self.semantic_cache = []  # [(unit query vector, result, created_at)]
+        self.semantic_cache_lock = threading.Lock()
     
     def load_uploads_db(self) -> Dict:
         """Load the JSON Map (Fast Brain)"""
-        DB_FILE = "uploads_db.json"
-        
-        if os.path.exists(DB_FILE):
-            with open(DB_FILE, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                return json.loads(content) if content else {"documents": {}}
+        if os.path.exists(UPLOADS_DB_FILE) and os.path.getsize(UPLOADS_DB_FILE) > 0:
+            return core.read_json_file(UPLOADS_DB_FILE)
         return {"documents": {}}
     
+    def uploads_db_signature(self) -> Optional[Tuple[int, int]]:
+        """(mtime_ns, size) of uploads_db.json, or None if it does not exist."""
+        try:
+            stat = os.stat(UPLOADS_DB_FILE)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def build_section_index(self, uploads_db: Dict) -> Dict[str, Dict[str, Any]]:
+        """
+        Flattens the JSON Map into section_id → Fast Path result, with every field
+        and default filled in once here. The first document holding an ID wins.
+        """
+        index = {}
+        for document in uploads_db.get("documents", {}).values():
+            act = document.get("act", "UNKNOWN")
+            filename = document.get("filename", "")
+            
+            for section_id, section_data in document.get("sections", {}).items():
+                if section_id in index:
+                    continue
+                index[section_id] = {
+                    "found": True,
+                    "section_id": section_id,
+                    "title": section_data.get("title", ""),
+                    "summary": section_data.get("summary", ""),
+                    "severity": section_data.get("severity", "N/A"),
+                    "bailable": section_data.get("bailable", "N/A"),
+                    "keywords": section_data.get("keywords", []),
+                    "page": section_data.get("page", 0),
+                    "act": act,
+                    "filename": filename,
+                    "chroma_uuid": section_data.get("chroma_uuid", ""),
+                    "crime": section_data.get("crime", "")
+                }
+        return index
+    
     def reload_db(self):
-        """Reload the database (call after new ingestion)"""
+        """Reload the database if uploads_db.json changed since it was last read"""
+        signature = self.uploads_db_signature()
+        if signature == self.db_signature:
+            return
+        
+        self.db_signature = signature
         self.uploads_db = self.load_uploads_db()
+        self.section_index = self.build_section_index(self.uploads_db)
+        
+        # New or changed documents can change Deep Path answers
+        with self.semantic_cache_lock:
+            self.semantic_cache.clear()
     
     
     # ========================================================================
@@ -67,25 +177,13 @@ class QueryRouter:
             or None if no match
         """
         
-        # Comprehensive regex patterns
-        patterns = [
-            r'(?:Section|Sec\.?)\s*(\d+[A-Z]*)',
-            r'(?:Article|Art\.?)\s*(\d+[A-Z]*)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, query, re.IGNORECASE)
-            if match:
-                section_id = match.group(1).strip().upper()
-                
-                # Determine type
-                query_type = "article" if "article" in pattern.lower() else "section"
-                
-                return {
-                    "type": query_type,
-                    "id": section_id,
-                    "original_query": query
-                }
+        match = SECTION_QUERY_PATTERN.search(query)
+        if match:
+            return {
+                "type": "article" if match.group("article") else "section",
+                "id": match.group("id").upper(),
+                "original_query": query
+            }
         
         return None
     
@@ -117,29 +215,9 @@ class QueryRouter:
             or None if not found
         """
         
-        section_id = section_info["id"]
-        
-        # Search across all documents
-        for file_id, document in self.uploads_db.get("documents", {}).items():
-            sections = document.get("sections", {})
-            
-            if section_id in sections:
-                section_data = sections[section_id]
-                
-                return {
-                    "found": True,
-                    "section_id": section_id,
-                    "title": section_data.get("title", ""),
-                    "summary": section_data.get("summary", ""),
-                    "severity": section_data.get("severity", "N/A"),
-                    "bailable": section_data.get("bailable", "N/A"),
-                    "keywords": section_data.get("keywords", []),
-                    "page": section_data.get("page", 0),
-                    "act": document.get("act", "UNKNOWN"),
-                    "filename": document.get("filename", ""),
-                    "chroma_uuid": section_data.get("chroma_uuid", ""),
-                    "crime": section_data.get("crime", "")
-                }
+        entry = self.section_index.get(section_info["id"])
+        if entry:
+            return dict(entry)
         
         return None
     
@@ -151,25 +229,10 @@ class QueryRouter:
         Returns markdown-formatted text suitable for display.
         """
         
-        response = f"""### 📋 Section {lookup_result['section_id']}: {lookup_result['title']}
-
-**Summary:** {lookup_result['summary']}
-
-**Legal Details:**
-- **Severity:** {lookup_result['severity']}
-- **Bailable:** {lookup_result['bailable']}
-- **Crime Category:** {lookup_result['crime']}
-
-**Source:** {lookup_result['act']} (Page {lookup_result['page']})
-
-**Related Keywords:** {', '.join(lookup_result['keywords'][:5])}
-
----
-
-*This information was retrieved instantly from {lookup_result['filename']}*
-"""
-        
-        return response.strip()
+        return FAST_RESPONSE_TEMPLATE.format_map({
+            **lookup_result,
+            "keywords_str": ', '.join(lookup_result['keywords'][:5])
+        })
     
     
     # ========================================================================
@@ -186,6 +249,10 @@ class QueryRouter:
         Returns: List of expanded queries (max 5)
         """
         
+        # Bare references like "Section 999" have nothing to expand
+        if len(query.split()) < 4 and SECTION_QUERY_PATTERN.search(query):
+            return [query]
+        
         prompt = f"""You are a legal search expert. Expand this user query into related legal terms and common phrases.
 
 USER QUERY: "{query}"
@@ -204,13 +271,21 @@ IMPORTANT: Return ONLY the JSON array, no explanations.
         try:
             response = core.safe_llm_invoke(prompt, max_tokens=150, temperature=0.5)
             
-            # Clean and parse
-            response = response.replace("```json", "").replace("```", "").strip()
-            expansions = json.loads(response)
+            # Clean and parse (first complete JSON value; prose around it is ignored)
+            response = JSON_FENCE_PATTERN.sub("", response).strip()
+            try:
+                expansions = core.extract_json(response)
+            except ValueError:
+                # Truncated array: salvage every string literal that was completed
+                start = response.find("[")
+                expansions = [
+                    json.loads(match.group(0))
+                    for match in JSON_STRING_PATTERN.finditer(response, start + 1)
+                ] if start != -1 else []
             
             # Validate it's a list
             if isinstance(expansions, list):
-                return [query] + expansions[:4]  # Original + 4 expansions
+                return [query] + [e for e in expansions if isinstance(e, str) and e.strip()][:4]  # Original + 4 expansions
             
         except Exception as e:
             print(f"Query expansion failed: {e}")
@@ -236,8 +311,6 @@ IMPORTANT: Return ONLY the JSON array, no explanations.
         Returns: List of (Document, score) tuples
         """
         
-        from retrieval import retrieve_context
-        
         # Optional query expansion
         if use_expansion:
             expanded_queries = self.expand_query(query)
@@ -247,14 +320,15 @@ IMPORTANT: Return ONLY the JSON array, no explanations.
         
         # Retrieve context using existing retrieval logic
         # The retrieve_context function already handles:
-        # - Multi-query search
+        # - Multi-query search (our expansions, embedded and searched in one batch)
         # - Deduplication
         # - Reranking
         
-        results = retrieve_context(
+        results = self.retrieve_context(
             query_text=query,
             n_results=n_results * 2,  # Get more initially for better reranking
-            language='en'
+            language='en',
+            expanded_queries=expanded_queries[1:]  # [0] is the original query
         )
         
         return results[:n_results]
@@ -273,37 +347,23 @@ IMPORTANT: Return ONLY the JSON array, no explanations.
         """
         
         # Build context string
-        context_parts = []
-        for i, (doc, score) in enumerate(context_docs, 1):
-            metadata = doc.metadata
-            section_id = metadata.get('section_id', 'UNKNOWN')
-            act = metadata.get('act', 'UNKNOWN')
-            
-            context_parts.append(f"""
-[SOURCE {i}]
-Section: {section_id} ({act})
-Content: {doc.page_content[:800]}
----""")
-        
-        context_str = "\n".join(context_parts)
-        
-        # Build history context
-        history_str = ""
-        if chat_history:
-            recent_history = chat_history[-4:]  # Last 2 exchanges
-            for msg in recent_history:
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                history_str += f"{role.upper()}: {content}\n"
-        
-        # Anti-hallucination prompt
-        system_prompt = f"""You are Kira, a legal AI assistant. Answer the user's question using ONLY the provided context.
-
-CRITICAL RULES:
-1. **CITE EXPLICITLY**: Always mention Section numbers and Act names (e.g., "Section 304 of BNS")
-2. **NO HALLUCINATION**: If the context doesn't contain the answer, say "I don't have information about that in the uploaded documents."
-3. **DISTINGUISH**: Clearly separate "Definition" vs "Punishment" when both are present
-4. **NATURAL TONE**: Be conversational but precise
+        context_str = "\n".join(
+            f"\n[SOURCE {i}]\n"
+            f"Section: {doc.metadata.get('section_id', 'UNKNOWN')} ({doc.metadata.get('act', 'UNKNOWN')})\n"
+            f"Content: {doc.page_content[:800]}\n"
+            f"---"
+            for i, (doc, score) in enumerate(context_docs, 1)
+        )
+        
+        # Build history context (last 2 exchanges)
+        history_str = "".join(
+            f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}\n"
+            for msg in chat_history[-4:]
+        )
+        
+        # Anti-hallucination prompt: the fixed rules lead, so llama.cpp can reuse their
+        # KV cache from the previous answer and only prefill the per-query part
+        system_prompt = f"""{GROUNDED_ANSWER_RULES}
 
 CONTEXT:
 {context_str}
@@ -325,7 +385,45 @@ ANSWER (use markdown formatting):"""
             
         except Exception as e:
             print(f"Answer generation failed: {e}")
-            return "I encountered an error while processing your request. Please try again."
+            return GENERATION_ERROR_RESPONSE
+    
+    
+    # ========================================================================
+    # SEMANTIC CACHE (Deep Path answers keyed by query embedding)
+    # ========================================================================
+    
+    def embed_for_cache(self, query: str) -> np.ndarray:
+        """Embeds the query with the retrieval embedding function, L2-normalized."""
+        vector = np.asarray(core.get_embedding_function().embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def semantic_cache_lookup(self, query_vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached result of the most similar recent query if its cosine
+        similarity reaches SEMANTIC_CACHE_THRESHOLD, else None.
+        """
+        now = time.time()
+        with self.semantic_cache_lock:
+            self.semantic_cache = [
+                entry for entry in self.semantic_cache
+                if now - entry[2] < SEMANTIC_CACHE_TTL_SECONDS
+            ]
+            if not self.semantic_cache:
+                return None
+            
+            scores = np.stack([entry[0] for entry in self.semantic_cache]) @ query_vector
+            best = int(np.argmax(scores))
+            if scores[best] >= SEMANTIC_CACHE_THRESHOLD:
+                return self.semantic_cache[best][1]
+        return None
+    
+    def semantic_cache_store(self, query_vector: np.ndarray, result: Dict[str, Any]):
+        """Caches a Deep Path result, evicting the oldest entry when full."""
+        with self.semantic_cache_lock:
+            self.semantic_cache.append((query_vector, result, time.time()))
+            if len(self.semantic_cache) > SEMANTIC_CACHE_MAX_ENTRIES:
+                del self.semantic_cache[0]
     
     
     # ========================================================================
@@ -343,22 +441,59 @@ ANSWER (use markdown formatting):"""
         
         Returns:
             {
-                "path": "fast" | "deep",
+                "path": "fast" | "deep" | "cache",
                 "response": str,
                 "sources": List[Dict],
                 "latency_ms": int
             }
         """
         
-        import time
-        start_time = time.time()
+        # Status messages go through a queue drained on a background thread, so a
+        # slow sink (socket/SSE emit) never stalls routing. The thread runs in a copy
+        # of the caller's contextvars, so context-bound callbacks (Flask-SocketIO's
+        # emit reads the request context) behave as if called from the handler.
+        status_queue = None
+        if status_callback:
+            status_queue = queue.SimpleQueue()
+            pump = threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(self.pump_status, status_queue, status_callback),
+                daemon=True
+            )
+            pump.start()
         
         def send_status(msg: str):
-            if status_callback:
-                status_callback(msg)
+            if status_queue is not None:
+                status_queue.put(msg)
             print(f"[ROUTER] {msg}")
         
-        # Reload DB to ensure latest data
+        try:
+            return self._route_query(query, chat_history, send_status)
+        finally:
+            if status_queue is not None:
+                # Flush the remaining messages before the caller sees the result
+                # (and before the caller's request context is torn down)
+                status_queue.put(None)
+                pump.join()
+    
+    @staticmethod
+    def pump_status(status_queue: "queue.SimpleQueue", status_callback):
+        """Delivers queued status messages in order until the None sentinel."""
+        while True:
+            msg = status_queue.get()
+            if msg is None:
+                return
+            try:
+                status_callback(msg)
+            except Exception as e:
+                print(f"Status callback failed: {e}")
+    
+    def _route_query(self, query: str, chat_history: List[Dict], send_status) -> Dict[str, Any]:
+        """route_query body; send_status reports progress without blocking."""
+        
+        start_time = time.perf_counter_ns()
+        
+        # Reload DB if it changed since the last query
         self.reload_db()
         
         # STEP 1: Check for Section/Article pattern
@@ -374,7 +509,7 @@ ANSWER (use markdown formatting):"""
             
             if lookup_result:
                 response = self.format_fast_response(lookup_result, query)
-                latency = int((time.time() - start_time) * 1000)
+                latency = (time.perf_counter_ns() - start_time) // 1_000_000
                 
                 send_status(f"✅ Found in {latency}ms (Fast Path)")
                 
@@ -389,18 +524,35 @@ ANSWER (use markdown formatting):"""
                 send_status(f"⚠ Section {section_info['id']} not found in database")
                 # Fall through to deep path
         
+        # SEMANTIC CACHE (standalone, non-section questions only: follow-ups depend on
+        # the history, and "Section 406" / "Section 420" embed too close to tell apart)
+        query_vector = None
+        if section_info is None and not chat_history:
+            try:
+                query_vector = self.embed_for_cache(query)
+                cached = self.semantic_cache_lookup(query_vector)
+            except Exception as e:
+                print(f"Semantic cache lookup failed: {e}")
+                cached = None
+            
+            if cached:
+                latency = (time.perf_counter_ns() - start_time) // 1_000_000
+                send_status(f"✅ Answered from semantic cache in {latency}ms")
+                return {**cached, "path": "cache", "latency_ms": latency}
+        
         # DEEP PATH
         send_status("🧠 Initiating semantic search...")
         send_status("📊 Retrieving relevant context...")
         
-        context_docs = self.deep_search(query, n_results=5, use_expansion=True)
+        # A missed Section/Article lookup gains nothing from LLM expansion
+        context_docs = self.deep_search(query, n_results=5, use_expansion=section_info is None)
         
         if not context_docs:
             return {
                 "path": "deep",
                 "response": "I couldn't find relevant information in the uploaded documents. Please try rephrasing your question or upload relevant legal documents.",
                 "sources": [],
-                "latency_ms": int((time.time() - start_time) * 1000)
+                "latency_ms": (time.perf_counter_ns() - start_time) // 1_000_000
             }
         
         send_status(f"✓ Retrieved {len(context_docs)} relevant sections")
@@ -419,15 +571,19 @@ ANSWER (use markdown formatting):"""
                 "relevance_score": float(score)
             })
         
-        latency = int((time.time() - start_time) * 1000)
+        latency = (time.perf_counter_ns() - start_time) // 1_000_000
         send_status(f"✅ Complete in {latency}ms (Deep Path)")
         
-        return {
+        result = {
             "path": "deep",
             "response": response,
             "sources": sources,
             "latency_ms": latency
         }
+        if query_vector is not None and response != GENERATION_ERROR_RESPONSE:
+            self.semantic_cache_store(query_vector, result)
+        
+        return result
 
 
 # ============================================================================
@@ -436,12 +592,16 @@ ANSWER (use markdown formatting):"""
 
 # Global router instance
 _router = None
+_router_lock = threading.Lock()
 
 def get_router() -> QueryRouter:
     """Get or create the global QueryRouter instance"""
     global _router
     if _router is None:
-        _router = QueryRouter()
+        # Concurrent first requests must not each build a router and read the DB
+        with _router_lock:
+            if _router is None:
+                _router = QueryRouter()
     return _router
 
 